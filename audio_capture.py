@@ -0,0 +1,384 @@
+# Description:
+# Pipeline de capture audio en memoire pour le push-to-talk.
+# Les chunks du micro sont copies dans un tampon pre-alloue (agrandi par doublement
+# jusqu'a une duree max), puis l'AudioData du recognizer est construit directement
+# depuis ce tampon : plus de fichier WAV dans /tmp, une seule copie de l'enregistrement.
+# La capture se fait a 16 kHz (frequence native de la reconnaissance vocale) quand le
+# micro le permet ; sinon on reechantillonne chunk par chunk avec NumPy.
+# AudioDevice garde le flux micro ouvert en permanence, avec un tampon circulaire de
+# pre-roll : l'appui sur K2 ne paie plus l'init PortAudio/ALSA et la premiere syllabe
+# n'est plus coupee.
+#
+# Lancer `python audio_capture.py` pour verifier le filtre anti-repliement du
+# reechantillonnage (attenuation hors bande, perte dans la bande de la parole).
+
+import collections
+import math
+import queue
+import threading
+import time
+
+import numpy as np
+import speech_recognition as sr
+
+# Frequence cible pour la reconnaissance vocale
+TARGET_RATE = 16000
+
+# Frequences essayees, comme dans test_mic_usb.py (16 kHz natif en premier)
+CAPTURE_RATES = [16000, 48000, 44100]
+
+# Filtre anti-repliement du reechantillonnage (FIR sinc fenetre par Blackman) :
+# coupure a 7.2 kHz, et tout ce qui se replierait sous la coupure (au-dessus de
+# 16000 - 7200 = 8.8 kHz) est attenue d'environ 70 dB
+ANTIALIAS_CUTOFF_HZ = 7200.0
+ANTIALIAS_MIN_TAPS = 31
+
+
+def pick_capture_rate(p, fmt, device_index=None, channels=1, rates=CAPTURE_RATES):
+    """
+    Returns the first rate of 'rates' supported by the input device,
+    or None if none of them is.
+    Args:
+        p (pyaudio.PyAudio): PortAudio instance.
+        fmt (int): Sample format (e.g. pyaudio.paInt16).
+    """
+    if device_index is None:
+        try:
+            device_index = p.get_default_input_device_info()['index']
+        except IOError:
+            return None
+    for rate in rates:
+        try:
+            if p.is_format_supported(rate, input_device=device_index,
+                                     input_channels=channels, input_format=fmt):
+                return rate
+        except ValueError:
+            pass
+    return None
+
+
+def lowpass_kernel(rate, cutoff_hz, stop_hz, min_taps=ANTIALIAS_MIN_TAPS):
+    """
+    Blackman-windowed sinc low-pass FIR (unity DC gain) for sample rate
+    'rate'. The tap count (odd, at least min_taps) gives a transition band
+    from cutoff_hz to stop_hz, beyond which the attenuation is about 70 dB.
+    """
+    taps = max(min_taps, int(math.ceil(5.5 * rate / (stop_hz - cutoff_hz))))
+    taps |= 1  # Nombre impair : retard de groupe entier
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = np.sinc(2 * cutoff_hz / rate * n) * np.blackman(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+class Resampler:
+    """
+    Streaming int16 mono resampler (windowed-sinc low-pass + linear
+    interpolation). State is kept between chunks so there is no
+    discontinuity at chunk edges.
+    """
+    def __init__(self, in_rate, out_rate=TARGET_RATE):
+        self.in_rate = in_rate
+        self.out_rate = out_rate
+        self.ratio = in_rate / out_rate
+        # Filtre anti-repliement, seulement pour un sous-echantillonnage
+        self._kernel = None
+        if in_rate > out_rate:
+            cutoff = min(ANTIALIAS_CUTOFF_HZ, 0.45 * out_rate)
+            self._kernel = lowpass_kernel(in_rate, cutoff, out_rate - cutoff)
+        taps = len(self._kernel) if self._kernel is not None else 1
+        self._hist = np.zeros(taps - 1, dtype=np.float32)
+        self._tail = np.zeros(0, dtype=np.float32)
+        self._pos = 0.0  # Position du prochain echantillon de sortie dans le tampon courant
+
+    def process(self, data):
+        """Resamples a chunk of int16 PCM bytes, returns int16 PCM bytes."""
+        x = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+        if self._kernel is not None:
+            xh = np.concatenate((self._hist, x))
+            self._hist = xh[len(xh) - len(self._hist):]
+            x = np.convolve(xh, self._kernel, mode='valid')
+
+        buf = np.concatenate((self._tail, x))
+        if len(buf) < 2:
+            self._tail = buf
+            return b""
+
+        positions = np.arange(self._pos, len(buf) - 1, self.ratio)
+        y = np.interp(positions, np.arange(len(buf)), buf)
+
+        # Le dernier echantillon devient l'indice 0 du prochain tampon
+        nxt = positions[-1] + self.ratio if len(positions) else self._pos
+        self._pos = nxt - (len(buf) - 1)
+        self._tail = buf[-1:]
+        return np.clip(np.round(y), -32768, 32767).astype(np.int16).tobytes()
+
+
+class AudioBuffer:
+    """
+    Preallocated, growable PCM buffer with a maximum duration.
+    """
+    def __init__(self, rate, sample_width=2, channels=1, max_seconds=30.0, initial_seconds=5.0):
+        self.rate = rate
+        self.sample_width = sample_width
+        self.channels = channels
+        self.frame_bytes = sample_width * channels
+        self.max_bytes = int(max_seconds * rate) * self.frame_bytes
+        self._buf = bytearray(min(self.max_bytes, int(initial_seconds * rate) * self.frame_bytes))
+        self.length = 0
+
+    @property
+    def duration(self):
+        return self.length / (self.rate * self.frame_bytes)
+
+    @property
+    def full(self):
+        return self.length >= self.max_bytes
+
+    def append(self, data):
+        """
+        Copies a chunk at the end of the buffer. Returns False once the
+        maximum duration is reached (the chunk is truncated to fit).
+        """
+        n = min(len(data), self.max_bytes - self.length)
+        end = self.length + n
+        if end > len(self._buf):
+            # Agrandissement par doublement, borne par la duree max
+            self._buf.extend(bytes(min(self.max_bytes, max(end, len(self._buf) * 2)) - len(self._buf)))
+        self._buf[self.length:end] = memoryview(data)[:n]
+        self.length = end
+        return not self.full
+
+    def trim(self, start, end):
+        """Keeps only bytes [start, end) of the recording, in place."""
+        end = min(end, self.length)
+        start = min(start, end)
+        start -= start % self.frame_bytes
+        end -= end % self.frame_bytes
+        del self._buf[end:]
+        del self._buf[:start]
+        self.length = max(0, end - start)
+
+    def detach(self):
+        """
+        Returns the recorded PCM as a bytearray trimmed in place (no copy).
+        The buffer must not be used afterwards.
+        """
+        buf = self._buf
+        del buf[self.length:]
+        self._buf = None
+        return buf
+
+    def to_audio_data(self):
+        """Builds a speech_recognition AudioData directly from memory."""
+        return sr.AudioData(self.detach(), self.rate, self.sample_width)
+
+
+def chunk_rms(data):
+    """RMS level of an int16 PCM chunk (same computation as the VU meter in test_mic_usb.py)."""
+    x = np.frombuffer(data, dtype=np.int16).astype(np.float32)
+    if not len(x):
+        return 0.0
+    rms = float(np.sqrt(np.mean(x ** 2)))
+    return 0.0 if np.isnan(rms) else rms
+
+
+class VoiceActivityDetector:
+    """
+    Energy-based VAD. Chunks are fed as they are recorded; once recording is
+    over, speech_bounds() gives the part of the buffer to keep.
+    """
+    def __init__(self, rate, sample_width=2, threshold=500.0, hangover_ms=300, min_speech_ms=150):
+        """
+        Args:
+            threshold (float): RMS level (int16 scale) above which a chunk is speech.
+            hangover_ms (int): Audio kept before the first and after the last speech chunk.
+            min_speech_ms (int): Minimum total speech for the recording to count.
+        """
+        self.bytes_per_ms = rate * sample_width / 1000.0
+        self.threshold = threshold
+        self.hangover_ms = hangover_ms
+        self.min_speech_ms = min_speech_ms
+        self.chunks = []  # (offset, longueur, rms)
+        self.offset = 0
+
+    def feed(self, data):
+        rms = chunk_rms(data)
+        self.chunks.append((self.offset, len(data), rms))
+        self.offset += len(data)
+        return rms
+
+    def speech_bounds(self):
+        """
+        Returns (start, end) byte offsets of the speech with hangover,
+        or None when nothing above the noise floor was captured.
+        """
+        speech = [(off, n) for off, n, rms in self.chunks if rms >= self.threshold]
+        if not speech or sum(n for _, n in speech) < self.min_speech_ms * self.bytes_per_ms:
+            return None
+        hang = int(self.hangover_ms * self.bytes_per_ms)
+        start = max(0, speech[0][0] - hang)
+        end = min(self.offset, speech[-1][0] + speech[-1][1] + hang)
+        return start, end
+
+
+class AudioDevice:
+    """
+    Persistent input stream, opened once and kept running.
+    Chunks (resampled to TARGET_RATE) always go through a small pre-roll
+    ring buffer; between start_capture() and stop_capture() they are also
+    queued for the recorder. The device is reopened automatically if the
+    stream stops (e.g. the USB mic was unplugged).
+    """
+    def __init__(self, pyaudio_module, device_index=None, chunk=1024, preroll_ms=300,
+                 rates=CAPTURE_RATES):
+        self.pyaudio = pyaudio_module
+        self.device_index = device_index
+        self.chunk = chunk
+        self.preroll_ms = preroll_ms
+        self.rates = rates
+        self.fmt = pyaudio_module.paInt16
+        self.sample_width = 2
+
+        self.p = None
+        self.stream = None
+        self.rate = None
+        self.resampler = None
+        self.overflows = 0
+
+        self._lock = threading.Lock()
+        self._ring = collections.deque()
+        self._queue = None
+        self._last_chunk_time = 0.0
+
+    @property
+    def ok(self):
+        return self.stream is not None and self.stream.is_active()
+
+    def open(self):
+        """Opens PortAudio and starts the stream. Returns False on failure."""
+        self.close()
+        try:
+            self.p = self.pyaudio.PyAudio()
+            self.rate = pick_capture_rate(self.p, self.fmt, self.device_index, rates=self.rates)
+            if self.rate is None:
+                raise IOError("Aucune frequence supportee par le micro")
+            self.resampler = Resampler(self.rate, TARGET_RATE) if self.rate != TARGET_RATE else None
+
+            # Nombre de chunks (a 16 kHz) pour couvrir le pre-roll
+            out_chunk = self.chunk * TARGET_RATE / self.rate
+            with self._lock:
+                self._ring = collections.deque(
+                    maxlen=max(1, math.ceil(self.preroll_ms * TARGET_RATE / 1000.0 / out_chunk)))
+
+            self.stream = self.p.open(format=self.fmt, channels=1, rate=self.rate, input=True,
+                                      input_device_index=self.device_index,
+                                      frames_per_buffer=self.chunk, stream_callback=self._callback)
+            self.stream.start_stream()
+            self._last_chunk_time = time.monotonic()
+            print(f"Micro ouvert : capture a {self.rate} Hz (pre-roll {self.preroll_ms} ms)")
+            return True
+        except Exception as e:
+            print(f"Erreur micro : {e}")
+            self.close()
+            return False
+
+    def close(self):
+        if self.stream is not None:
+            try:
+                self.stream.stop_stream()
+                self.stream.close()
+            except Exception:
+                pass
+            self.stream = None
+        if self.p is not None:
+            # terminate() est necessaire pour re-enumerer un micro USB rebranche
+            self.p.terminate()
+            self.p = None
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        if status & self.pyaudio.paInputOverflow:
+            self.overflows += 1
+        data = self.resampler.process(in_data) if self.resampler is not None else in_data
+        with self._lock:
+            self._ring.append(data)
+            if self._queue is not None:
+                self._queue.put(data)
+        self._last_chunk_time = time.monotonic()
+        return (None, self.pyaudio.paContinue)
+
+    def ensure_open(self, stall_seconds=1.0):
+        """Reopens the device if the stream died or stopped delivering audio."""
+        if self.ok and time.monotonic() - self._last_chunk_time < stall_seconds:
+            return True
+        print("Micro indisponible, reouverture...")
+        return self.open()
+
+    def start_capture(self):
+        """
+        Starts queueing chunks for a recording. The queue already holds the
+        last ~preroll_ms of audio. Returns False if the device is unavailable.
+        """
+        if not self.ensure_open():
+            return False
+        with self._lock:
+            self._queue = queue.Queue()
+            for data in self._ring:
+                self._queue.put(data)
+        return True
+
+    def read(self, timeout=0.5):
+        """Next captured chunk, or None on timeout (the device is then checked)."""
+        q = self._queue
+        if q is None:
+            return None
+        try:
+            return q.get(timeout=timeout)
+        except queue.Empty:
+            self.ensure_open()
+            return None
+
+    def stop_capture(self):
+        with self._lock:
+            self._queue = None
+
+
+def check_antialias(rates=(48000, 44100), stop_tones=(9000.0, 12000.0, 20000.0),
+                    pass_tones=(300.0, 1000.0, 3400.0), seconds=1.0, chunk=1024):
+    """
+    Resamples pure tones to TARGET_RATE chunk by chunk, as the capture does.
+    Returns (rate, frequency, gain_db) for each tone: out-of-band tones
+    (stop_tones) must come out attenuated, speech-band ones (pass_tones) intact.
+    """
+    results = []
+    for rate in rates:
+        for freq in stop_tones + pass_tones:
+            t = np.arange(int(seconds * rate)) / rate
+            x = np.round(8000 * np.sin(2 * np.pi * freq * t)).astype(np.int16).tobytes()
+            r = Resampler(rate, TARGET_RATE)
+            y = b"".join(r.process(x[i:i + chunk * 2]) for i in range(0, len(x), chunk * 2))
+            y = np.frombuffer(y, dtype=np.int16).astype(np.float64)
+            # Regime etabli : on ignore le retard du filtre au debut
+            y = y[len(y) // 10:]
+            rms_in = 8000 / math.sqrt(2)
+            rms_out = max(math.sqrt(np.mean(y * y)), 1e-9)
+            results.append((rate, freq, 20 * math.log10(rms_out / rms_in)))
+    return results
+
+
+if __name__ == "__main__":
+    import sys
+
+    # Verification du filtre anti-repliement : >= 40 dB d'attenuation hors bande,
+    # moins de 1 dB de perte dans la bande de la parole
+    STOP_MIN_DB = 40.0
+    PASS_MAX_DB = 1.0
+    failed = False
+    stop_tones = (9000.0, 12000.0, 20000.0)
+    for rate, freq, gain in check_antialias(stop_tones=stop_tones):
+        if freq in stop_tones:
+            ok = gain <= -STOP_MIN_DB
+        else:
+            ok = gain >= -PASS_MAX_DB
+        failed |= not ok
+        print(f"{rate} Hz, ton {freq:7.0f} Hz : {gain:7.1f} dB {'OK' if ok else 'ECHEC'}")
+    sys.exit(1 if failed else 0)
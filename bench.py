@@ -0,0 +1,285 @@
+# Description:
+# Micro-benchmarks des chemins critiques du rendu et du transport, sans materiel
+# (backends simules de sim_hardware.py, SPI sans temporisation de bus).
+# Mesure : wrap_text_pixel, create_bot_strip, update_side_screens, la conversion RGB565
+# dans ST7789.display / display_raw, et le cout d'une trame de la boucle d'affichage.
+#
+# Usage :
+#   python bench.py                         # resultats JSON sur la sortie standard
+#   python bench.py -o baseline.json        # sauvegarde d'une reference
+#   python bench.py --baseline baseline.json [--threshold 0.10]
+#                                           # comparaison, code retour 1 si regression
+#   python bench.py -k wrap                 # seulement les cas dont le nom contient 'wrap'
+#
+# Chaque cas est calibre pour durer au moins --min-time par serie, puis repete
+# --repeat fois ; on garde la mediane et le minimum par operation (GC desactive).
+
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+# Materiel simule, sans duree de transfert : on mesure le CPU, pas le bus
+os.environ.setdefault("IANA_HARDWARE", "sim")
+import sim_hardware
+sim_hardware.SPI_TIMING = False
+
+from PIL import Image, ImageDraw
+
+import push_to_talk_v2 as app
+import text_layout
+from display import ST7789
+from rgb565 import HAS_NUMPY, image_to_rgb565
+from waveshare_config import LCD_1_3
+
+SHORT_TEXT = "Bonjour, je suis Iana. Que puis-je faire pour vous ?"
+LONG_TEXT = (
+    "La photosynthèse est le processus par lequel les plantes, les algues et certaines "
+    "bactéries convertissent l'énergie lumineuse en énergie chimique. Elle se déroule "
+    "principalement dans les chloroplastes, grâce à la chlorophylle qui absorbe la lumière "
+    "rouge et bleue. L'eau est décomposée, libérant de l'oxygène, tandis que le dioxyde de "
+    "carbone est fixé pour produire des sucres. Ce mécanisme est à la base de presque toutes "
+    "les chaînes alimentaires terrestres et a façonné la composition de notre atmosphère. "
+) * 4
+ANSWER_LENGTHS = {"short": 60, "medium": 600, "long": 3000}
+
+
+def timed(func, repeat=7, min_time=0.1):
+    """
+    Returns per-call timings (seconds) of 'func': the number of calls per
+    series is doubled until a series lasts 'min_time', then 'repeat' series
+    are measured.
+    """
+    func()  # Echauffement (caches, imports paresseux)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            runs.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return runs, number
+
+
+# --- Cas mesures ---
+def case_wrap():
+    font, width = app.font_text, app.disp.width - 10
+
+    def cold():
+        text_layout._cache.clear()
+        text_layout.wrap_text_pixel(LONG_TEXT, font, width)
+
+    return {
+        "wrap_text_pixel/short": lambda: text_layout.wrap_text_pixel(SHORT_TEXT, font, width),
+        "wrap_text_pixel/long": lambda: text_layout.wrap_text_pixel(LONG_TEXT, font, width),
+        "wrap_text_pixel/long_cold": cold,
+    }
+
+
+def case_bot_strip():
+    cases = {}
+    w, h = app.disp.width, app.disp.height
+    for name, n in ANSWER_LENGTHS.items():
+        text = (LONG_TEXT * (n // len(LONG_TEXT) + 1))[:n]
+
+        def layout(text=text):
+            app.create_bot_strip(text, w, h, app.font_text)
+
+        def first_frame(text=text):
+            strip = app.create_bot_strip(text, w, h, app.font_text)
+            strip.viewport(0, h)
+
+        cases[f"create_bot_strip/{name}"] = layout
+        cases[f"create_bot_strip+first_frame/{name}"] = first_frame
+    return cases
+
+
+def case_side_screens():
+    def cold():
+        app.side_frame_cache.clear()
+        app.update_side_screens("Iana réfléchit...", "THINKING")
+
+    return {
+        "update_side_screens/cold": cold,
+        "update_side_screens/cached": lambda: app.update_side_screens("Iana réfléchit...", "THINKING"),
+    }
+
+
+def _noise_image(width, height, seed):
+    img = Image.new('RGB', (width, height), (0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, height, 8):
+        draw.line((0, i, width, (i * seed) % height), fill=((i * 7 * seed) % 256, (i * 3) % 256, 255 - i % 256))
+    return img
+
+
+def case_driver():
+    disp = ST7789(dict(LCD_1_3))
+    w, h = disp.width, disp.height
+    frames = [_noise_image(w, h, 1), _noise_image(w, h, 3)]
+    # Meme image avec un petit rectangle qui change (rafraichissement partiel)
+    partial = [frames[0].copy(), frames[0].copy()]
+    ImageDraw.Draw(partial[1]).rectangle((100, 100, 139, 119), fill=(255, 0, 0))
+    raw = image_to_rgb565(frames[0])
+    state = {"i": 0}
+
+    def alternate(images):
+        def run():
+            state["i"] ^= 1
+            disp.display(images[state["i"]])
+        return run
+
+    cases = {
+        "rgb565/image_to_rgb565": lambda: image_to_rgb565(frames[0]),
+        "st7789.display/full": alternate(frames),
+        "st7789.display/partial": alternate(partial),
+        "st7789.display/unchanged": lambda: disp.display(frames[0]),
+        "st7789.display_raw/full": lambda: disp.display_raw([raw]),
+    }
+    return cases
+
+
+def case_display_frame():
+    w, h = app.disp.width, app.disp.height
+    static = app.create_bot_strip(SHORT_TEXT, w, h, app.font_text)
+    scrolling = app.create_bot_strip(LONG_TEXT, w, h, app.font_text)
+    # Une seule boucle (un seul abonne a l'etat UI) pour tous les cas : chaque cas
+    # publie sa bande, ce qui remet la boucle a zero
+    loop = app.DisplayLoop()
+
+    def make(state, strip, user_text=""):
+        def setup():
+            app.ui.update(state=state, user_text=user_text, bot_strip=strip, strip_time=0.0)
+
+            def run():
+                loop.frame()
+                # Pas de pause de fin de bande pendant la mesure
+                if strip is not None and loop.scroll_y >= strip.height - h - app.SCROLL_SPEED:
+                    loop.scroll_y = 0.0
+            return run
+        return setup
+
+    return {
+        "display_frame/static": make("IDLE", static),
+        "display_frame/scrolling": make("IDLE", scrolling),
+        "display_frame/validate": make("VALIDATE", None, SHORT_TEXT),
+    }
+
+
+SUITES = [case_wrap, case_bot_strip, case_side_screens, case_driver, case_display_frame]
+
+
+def run_suite(pattern=None, repeat=7, min_time=0.1):
+    results = {}
+    for suite in SUITES:
+        for name, func in suite().items():
+            if pattern and pattern not in name:
+                continue
+            if suite is case_display_frame:
+                func = func()  # Publication de l'etat UI de ce cas
+            runs, number = timed(func, repeat, min_time)
+            results[name] = {
+                "median_us": statistics.median(runs) * 1e6,
+                "min_us": min(runs) * 1e6,
+                "number": number,
+                "repeat": repeat,
+            }
+            print(f"{name:<40} {results[name]['median_us']:12.1f} us", file=sys.stderr)
+    return results
+
+
+def machine_info():
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "numpy": HAS_NUMPY,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the ratio to the baseline for each case. Returns the names of
+    cases slower than baseline by more than 'threshold' (e.g. 0.10 = +10%).
+    """
+    regressions = []
+    print(f"{'cas':<40} {'reference':>12} {'actuel':>12} {'ratio':>8}", file=sys.stderr)
+    for name, res in results.items():
+        ref = baseline.get(name)
+        if ref is None:
+            print(f"{name:<40} {'-':>12} {res['median_us']:12.1f} {'nouveau':>8}", file=sys.stderr)
+            continue
+        ratio = res['median_us'] / ref['median_us']
+        mark = ""
+        if ratio > 1 + threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 - threshold:
+            mark = "  gain"
+        print(f"{name:<40} {ref['median_us']:12.1f} {res['median_us']:12.1f} {ratio:8.2f}{mark}",
+              file=sys.stderr)
+        res['baseline_us'] = ref['median_us']
+        res['ratio'] = ratio
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks rendu/transport (sans materiel)")
+    parser.add_argument("-o", "--output", help="Fichier JSON de resultats (defaut : sortie standard)")
+    parser.add_argument("--baseline", help="Fichier JSON de reference a comparer")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Ecart relatif signale comme regression ou gain (defaut 0.10)")
+    parser.add_argument("-k", dest="pattern", help="Ne lance que les cas contenant ce texte")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.1,
+                        help="Duree minimale d'une serie, en secondes")
+    args = parser.parse_args()
+
+    # Ecrans seulement (pas de micro, d'Ollama ni de fichiers : aucun thread de fond
+    # ne partage le CPU avec les mesures), et sans le thread d'ecriture SPI : seul le
+    # cout cote producteur compte
+    app.init_displays()
+    app.display_service.stop()
+
+    results = run_suite(args.pattern, args.repeat, args.min_time)
+    report = {"machine": machine_info(), "results": results}
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["baseline_machine"] = baseline.get("machine")
+        regressions = compare(results, baseline["results"], args.threshold)
+        report["regressions"] = regressions
+
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Description:
+# Gestion des boutons K1/K2 par interruptions (detection de fronts GPIO) au lieu de
+# boucles de scrutation. Chaque appui et relachement est horodate et transmis aux
+# abonnes (voir subscribe()) ; la boucle principale les recoit comme evenements.
+
+import threading
+import time
+from collections import namedtuple
+
+from hardware import GPIO
+
+# pin : broche BCM, pressed : True = appui, False = relachement, time : time.monotonic()
+ButtonEvent = namedtuple('ButtonEvent', ['pin', 'pressed', 'time'])
+
+
+class Buttons:
+    """
+    Edge-detected buttons (active low, internal pull-up) delivering events
+    to subscribers.
+    """
+    def __init__(self, pins, bouncetime_ms=20):
+        """
+        Args:
+            pins (list): BCM pin numbers (e.g. KEYS values from waveshare_config.py).
+            bouncetime_ms (int): Software debounce passed to add_event_detect.
+        """
+        self.pins = list(pins)
+        self.bouncetime_ms = bouncetime_ms
+        self._lock = threading.Lock()
+        self._pressed = {}
+        self._listeners = []
+
+        # Relectures en attente apres la fenetre anti-rebond : broche -> echeance,
+        # servies par un seul thread (un rebond ne fait que repousser l'echeance)
+        self._cond = threading.Condition()
+        self._resync_due = {}
+        self._closed = False
+        self._resync_thread = threading.Thread(target=self._resync_loop, name="buttons-resync",
+                                               daemon=True)
+        self._resync_thread.start()
+
+        GPIO.setmode(GPIO.BCM)
+        for pin in self.pins:
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+            self._pressed[pin] = GPIO.input(pin) == GPIO.LOW
+            GPIO.add_event_detect(pin, GPIO.BOTH, callback=self._on_edge, bouncetime=bouncetime_ms)
+
+    def _on_edge(self, pin):
+        self._sync(pin)
+        # Une lecture faite pendant un rebond peut encore donner l'ancien niveau, et
+        # bouncetime masque alors le vrai dernier front : on relit une fois le niveau
+        # stabilise, a la fin de la fenetre anti-rebond
+        with self._cond:
+            self._resync_due[pin] = time.monotonic() + self.bouncetime_ms / 1000.0 + 0.005
+            self._cond.notify()
+
+    def _resync_loop(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        return
+                    now = time.monotonic()
+                    ready = [pin for pin, due in self._resync_due.items() if due <= now]
+                    if ready:
+                        break
+                    if self._resync_due:
+                        self._cond.wait(min(self._resync_due.values()) - now)
+                    else:
+                        self._cond.wait()
+                for pin in ready:
+                    del self._resync_due[pin]
+            for pin in ready:
+                self._sync(pin)
+
+    def _sync(self, pin):
+        """Emits an event if the pin level differs from the tracked state."""
+        with self._lock:
+            now = time.monotonic()
+            pressed = GPIO.input(pin) == GPIO.LOW
+            if pressed == self._pressed[pin]:
+                return  # Rebond : l'etat n'a pas change
+            self._pressed[pin] = pressed
+            # Emis sous le verrou : les evenements d'une broche restent dans l'ordre
+            ev = ButtonEvent(pin, pressed, now)
+            for callback in self._listeners:
+                callback(ev)
+
+    def subscribe(self, callback):
+        """
+        Delivers events to callback(ButtonEvent). Edges seen before the first
+        subscription are not replayed. The callback runs in the GPIO (or
+        re-sync) thread and must not block.
+        """
+        with self._lock:
+            self._listeners.append(callback)
+
+    def close(self):
+        for pin in self.pins:
+            GPIO.remove_event_detect(pin)
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._resync_thread.join(1.0)
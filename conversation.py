@@ -0,0 +1,89 @@
+# Description:
+# Memoire de conversation multi-tours pour l'assistant, bornee par un budget de tokens.
+# Le prompt systeme est toujours le meme objet str, envoye en tete : le prefixe du prompt
+# reste identique octet pour octet d'un tour a l'autre, et Ollama peut reutiliser son
+# cache KV au lieu de re-evaluer tout l'historique.
+# Les tours les plus anciens sont oublies des que l'historique depasse le budget ; la
+# conversation repart de zero sur un geste explicite ou apres une periode d'inactivite.
+
+import math
+import time
+
+# Estimation grossiere pour le francais avec le tokenizer de llama3 (~3.5 caracteres par token)
+CHARS_PER_TOKEN = 3.5
+# Surcout approximatif du gabarit de chat par message (balises de role)
+TOKENS_PER_MESSAGE = 4
+
+
+def estimate_tokens(text):
+    """Approximate token count of 'text' (no tokenizer on the Pi)."""
+    return TOKENS_PER_MESSAGE + math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+class Conversation:
+    """
+    Bounded chat history: [system] + the most recent (user, assistant) turns
+    fitting in 'token_budget', plus the new question.
+    """
+    def __init__(self, system_prompt, token_budget=1024, idle_timeout=300.0):
+        """
+        Args:
+            system_prompt (str): Sent unchanged as the first message of every request.
+            token_budget (int): Max estimated tokens for system prompt + history + question.
+            idle_timeout (float): Seconds without a turn after which history is dropped.
+        """
+        self.system_prompt = system_prompt
+        self.token_budget = token_budget
+        self.idle_timeout = idle_timeout
+        self._system = {'role': 'system', 'content': system_prompt}
+        self.turns = []  # (message user, message assistant, tokens estimes)
+        self.last_turn_time = time.monotonic()
+        # Statistiques du dernier tour (rapportees par Ollama)
+        self.last_prompt_tokens = 0
+        self.last_eval_tokens = 0
+
+    def reset(self):
+        self.turns = []
+        self.last_turn_time = time.monotonic()
+
+    def expired(self):
+        return bool(self.turns) and time.monotonic() - self.last_turn_time > self.idle_timeout
+
+    def history_tokens(self):
+        return sum(n for _, _, n in self.turns)
+
+    def _trim(self, reserved):
+        """Drops the oldest turns until history + 'reserved' fits in the budget."""
+        while self.turns and self.history_tokens() + reserved > self.token_budget:
+            self.turns.pop(0)
+
+    def messages(self, prompt):
+        """
+        Builds the message list for a new question. History is reset first
+        if the conversation was idle for too long.
+        """
+        if self.expired():
+            print("Conversation inactive : historique efface")
+            self.reset()
+        self._trim(estimate_tokens(self.system_prompt) + estimate_tokens(prompt))
+        msgs = [self._system]
+        for user, assistant, _ in self.turns:
+            msgs.append(user)
+            msgs.append(assistant)
+        msgs.append({'role': 'user', 'content': prompt})
+        return msgs
+
+    def add_turn(self, prompt, answer, prompt_tokens=None, eval_tokens=None):
+        """
+        Records a completed turn. prompt_tokens / eval_tokens are Ollama's
+        prompt_eval_count / eval_count for it, when available.
+        """
+        tokens = estimate_tokens(prompt) + estimate_tokens(answer)
+        self.turns.append(({'role': 'user', 'content': prompt},
+                           {'role': 'assistant', 'content': answer}, tokens))
+        self.last_turn_time = time.monotonic()
+        self.last_prompt_tokens = prompt_tokens or 0
+        self.last_eval_tokens = eval_tokens or 0
+        print(f"Tour {len(self.turns)} : prompt evalue {self.last_prompt_tokens} tokens, "
+              f"reponse {self.last_eval_tokens} tokens, historique ~{self.history_tokens()}"
+              f"/{self.token_budget} tokens")
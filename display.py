@@ -4,11 +4,13 @@
 # logic found in the original test scripts (test_bonjour_3_ecrans.py) which are
 # confirmed to work on the Raspberry Pi 5.
 
-import spidev
-import RPi.GPIO as GPIO
+from hardware import spidev, GPIO
 import time
 from PIL import Image
 
+from orientation import resolve_orientation
+from rgb565 import image_to_rgb565, write_buffer, spidev_bufsiz, dirty_rects, extract_rect
+
 class ST7789:
     """
     Object-oriented driver for the Waveshare LCDs.
@@ -20,6 +22,8 @@ class ST7789:
             config (dict): A dictionary from waveshare_config.py (e.g., LCD_1_3).
         """
         self.config = config
+        # MADCTL, window offsets and logical size for the requested rotation
+        self.orientation = resolve_orientation(config)
         self.spi = spidev.SpiDev()
         
         # Use BCM GPIO numbering, as used in the working test scripts
@@ -30,6 +34,11 @@ class ST7789:
         self.spi.open(self.config['spi_bus'], self.config['spi_device'])
         self.spi.max_speed_hz = 60000000  # Set a high speed
         self.spi.mode = 0b00
+        self.bufsiz = spidev_bufsiz()
+
+        # Last frame sent to the panel (RGB565), used for partial refresh
+        self._framebuffer = None
+        self._framebuffer_size = None
 
         # Setup control pins
         GPIO.setup(self.config['rst'], GPIO.OUT)
@@ -65,59 +74,88 @@ class ST7789:
         self._send_data([0x05])  # 16-bit RGB565
         
         self._send_cmd(0x36)  # MADCTL (Memory Access Control)
-        self._send_data([self.config['madctl']])
+        self._send_data([self.orientation['madctl']])
         
         self._send_cmd(0x21)  # Display Inversion ON
         self._send_cmd(0x29)  # Display ON
 
-    def display(self, image):
-        """
-        Takes a PIL Image and displays it on the screen.
-        """
-        # Apply software rotation if needed (defined in config)
-        if self.config.get('rotation', 0) != 0:
-            image = image.rotate(self.config['rotation'])
+        # Panel RAM content is unknown after a reset
+        self._framebuffer = None
+
+    def _set_window(self, x0, y0, x1, y1):
+        """Sets the drawing window (inclusive, panel coordinates) and starts RAMWR."""
+        # Offsets for the current orientation (see orientation.py)
+        col_start = self.orientation['col_start']
+        row_start = self.orientation['row_start']
 
-        width, height = image.size
-        
-        # Get offsets from config, default to 0
-        col_start = self.config.get('col_start', 0)
-        row_start = self.config.get('row_start', 0)
-        
-        # Set the drawing window
         self._send_cmd(0x2A)  # CASET (Column Address Set)
-        x_end = col_start + width - 1
-        self._send_data([col_start >> 8, col_start & 0xFF, x_end >> 8, x_end & 0xFF])
-        
+        xs, xe = col_start + x0, col_start + x1
+        self._send_data([xs >> 8, xs & 0xFF, xe >> 8, xe & 0xFF])
+
         self._send_cmd(0x2B)  # RASET (Row Address Set)
-        y_end = row_start + height - 1
-        self._send_data([row_start >> 8, row_start & 0xFF, y_end >> 8, y_end & 0xFF])
-        
+        ys, ye = row_start + y0, row_start + y1
+        self._send_data([ys >> 8, ys & 0xFF, ye >> 8, ye & 0xFF])
+
         # Start memory write
         self._send_cmd(0x2C)  # RAMWR
-        
         GPIO.output(self.config['dc'], GPIO.HIGH)
-        
-        # Convert PIL image to RGB565 byte array
-        pixels = list(image.getdata())
-        data = []
-        for r, g, b in pixels:
-            val = ((r & 0xF8) << 8) | ((g & 0xFC) << 3) | (b >> 3)
-            data.append(val >> 8)
-            data.append(val & 0xFF)
-            
-        # Write data in chunks for performance
-        chunk_size = 4096
-        for i in range(0, len(data), chunk_size):
-            self.spi.writebytes(data[i:i+chunk_size])
+
+    def display(self, image):
+        """
+        Takes a PIL Image and displays it on the screen.
+        Only the regions that changed since the previous frame are sent,
+        unless they cover more than 'full_refresh_ratio' of the panel.
+        """
+        # Rotation is handled by MADCTL (see orientation.py): no work per frame
+        width, height = image.size
+
+        # Convert PIL image to a contiguous RGB565 buffer (vectorized)
+        buf = image_to_rgb565(image)
+
+        rects = None
+        prev = self._framebuffer
+        if self.config.get('partial_refresh', True) and prev is not None and len(prev) == len(buf) \
+                and self._framebuffer_size == (width, height):
+            rects = dirty_rects(prev, buf, width, height,
+                                max_rects=self.config.get('max_dirty_rects', 4))
+            area = sum((x1 - x0 + 1) * (y1 - y0 + 1) for x0, y0, x1, y1 in rects)
+            if area > self.config.get('full_refresh_ratio', 0.6) * width * height:
+                rects = None  # Trop de changements : ecriture complete
+
+        self._framebuffer = buf
+        self._framebuffer_size = (width, height)
+
+        if rects is None:
+            self._set_window(0, 0, width - 1, height - 1)
+            # Send it in bufsiz-sized transfers
+            write_buffer(self.spi, buf, self.bufsiz)
+            return
+
+        for rect in rects:
+            self._set_window(*rect)
+            write_buffer(self.spi, extract_rect(buf, width, rect), self.bufsiz)
+
+    def display_raw(self, segments):
+        """
+        Writes a full frame given as RGB565 buffers (e.g. memoryview slices of
+        an EncodedStrip). The segments are sent back to back in one RAMWR.
+        """
+        self._framebuffer = None
+        self._set_window(0, 0, self.width - 1, self.height - 1)
+        for seg in segments:
+            write_buffer(self.spi, seg, self.bufsiz)
+
+    def invalidate(self):
+        """Forgets the last frame so the next display() rewrites the whole panel."""
+        self._framebuffer = None
 
     @property
     def width(self):
-        return self.config['width']
+        return self.orientation['width']
 
     @property
     def height(self):
-        return self.config['height']
+        return self.orientation['height']
 
     def close(self):
         """Closes the SPI connection."""
@@ -0,0 +1,104 @@
+# Description:
+# Service d'affichage asynchrone : un thread d'ecriture par bus SPI.
+# Le 1.3" (SPI1) et les deux 0.96" (SPI0, partage) sont ecrits en parallele.
+# Chaque ecran a un tampon "derniere trame gagnante" : l'appelant soumet sa trame
+# sans bloquer, et si le bus est occupe la trame en attente est simplement remplacee.
+# Sur un bus partage, un seul thread fait les transferts : l'arbitrage est implicite.
+
+import threading
+
+
+class _BusWriter(threading.Thread):
+    """Writer thread owning every display of one SPI bus."""
+
+    def __init__(self, bus):
+        super().__init__(name=f"spi{bus}-writer", daemon=True)
+        self.bus = bus
+        self.cond = threading.Condition()
+        self.pending = {}  # display -> liste d'operations en attente
+        self.order = []    # ordre de soumission, pour servir les ecrans equitablement
+        self.running = True
+
+    def post(self, display, op, replace):
+        with self.cond:
+            if replace or display not in self.pending:
+                # Nouvelle trame complete : les operations precedentes sont obsoletes
+                self.pending[display] = [op]
+            else:
+                self.pending[display].append(op)
+            if display not in self.order:
+                self.order.append(display)
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.order:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                display = self.order.pop(0)
+                ops = self.pending.pop(display)
+
+            for func, args in ops:
+                try:
+                    func(*args)
+                except Exception as e:
+                    print(f"Erreur ecran {display.config['name']}: {e}")
+
+
+class DisplayService:
+    """
+    Owns one writer thread per SPI bus and dispatches frames to them.
+    """
+    def __init__(self, displays):
+        """
+        Args:
+            displays (list): ST7789 instances. They are grouped by 'spi_bus'.
+        """
+        self.writers = {}
+        self.bus_of = {}
+        for d in displays:
+            bus = d.config['spi_bus']
+            if bus not in self.writers:
+                self.writers[bus] = _BusWriter(bus)
+            self.bus_of[d] = bus
+
+    def start(self):
+        for w in self.writers.values():
+            w.start()
+
+    def stop(self, timeout=1.0):
+        """Stops the writers. Pending frames are dropped."""
+        for w in self.writers.values():
+            w.stop()
+        for w in self.writers.values():
+            if w.is_alive():
+                w.join(timeout)
+
+    def submit(self, display, image):
+        """
+        Queues a full frame for 'display' without blocking.
+        A frame that has not been sent yet is replaced (latest frame wins).
+        """
+        self.writers[self.bus_of[display]].post(display, (display.display, (image,)), replace=True)
+
+    def submit_rgb565(self, display, segments):
+        """
+        Same as submit() for a frame already encoded to RGB565
+        (list of buffers, see ST7789.display_raw).
+        """
+        self.writers[self.bus_of[display]].post(display, (display.display_raw, (segments,)), replace=True)
+
+    def submit_command(self, display, method, *args):
+        """
+        Queues a driver call (e.g. 'invalidate') after the pending operations of
+        'display'. Unlike frames, commands are never dropped, only superseded
+        by the next submit().
+        """
+        self.writers[self.bus_of[display]].post(display, (getattr(display, method), args), replace=False)
@@ -0,0 +1,39 @@
+# Description:
+# Point d'import unique du materiel (RPi.GPIO, spidev, pyaudio).
+# Le backend se choisit dans waveshare_config.py (HARDWARE) ou par la variable
+# d'environnement IANA_HARDWARE :
+# - "rpi" : vrais modules, sur le Raspberry Pi
+# - "sim" : backends simules de sim_hardware.py (SPI reconstruit en memoire, boutons
+#           scriptables, micro lu depuis test_mic.wav), pour profiler sur un PC.
+# Usage : from hardware import GPIO, spidev, pyaudio
+# Les modules sont importes a la demande : un script qui n'utilise pas le micro
+# n'a pas besoin de pyaudio.
+
+import importlib
+import os
+
+from waveshare_config import HARDWARE
+
+BACKEND = os.environ.get("IANA_HARDWARE", HARDWARE)
+SIMULATED = BACKEND == "sim"
+
+_REAL_MODULES = {
+    "GPIO": "RPi.GPIO",
+    "spidev": "spidev",
+    "pyaudio": "pyaudio",
+}
+
+if BACKEND not in ("rpi", "sim"):
+    raise ValueError(f"Backend materiel inconnu : {BACKEND} (choix : rpi, sim)")
+
+
+def __getattr__(name):
+    if name not in _REAL_MODULES:
+        raise AttributeError(f"module 'hardware' has no attribute '{name}'")
+    if SIMULATED:
+        import sim_hardware
+        module = getattr(sim_hardware, name)
+    else:
+        module = importlib.import_module(_REAL_MODULES[name])
+    globals()[name] = module
+    return module
@@ -0,0 +1,171 @@
+# Description:
+# Cycle de vie du modele Ollama : prechargement en arriere-plan au demarrage, maintien en
+# memoire (keep_alive) et rechauffage anticipe a l'appui sur K2, pour que le chargement
+# depuis la carte SD se fasse pendant l'enregistrement et la transcription plutot
+# qu'apres la validation.
+# L'etat de chargement est observable (subscribe) pour l'afficher sur les ecrans lateraux.
+
+import datetime
+import re
+import threading
+import time
+
+import ollama
+
+UNLOADED = "UNLOADED"
+LOADING = "LOADING"
+READY = "READY"
+ERROR = "ERROR"
+
+
+def keep_alive_seconds(keep_alive):
+    """
+    Converts an Ollama keep_alive value ("30m", "1h30m", "45s", 300, -1) to
+    seconds. Returns None when the model is never unloaded (negative value).
+    """
+    if isinstance(keep_alive, (int, float)):
+        seconds = float(keep_alive)
+    else:
+        text = str(keep_alive).strip()
+        try:
+            seconds = float(text)
+        except ValueError:
+            units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+            parts = re.findall(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)", text)
+            if not parts or "".join(n + u for n, u in parts) != text:
+                raise ValueError(f"keep_alive invalide : {keep_alive!r}")
+            seconds = sum(float(n) * units[u] for n, u in parts)
+    return None if seconds < 0 else seconds
+
+
+def _full_name(model):
+    """Ollama reports models with their tag ('llama3.2' -> 'llama3.2:latest')."""
+    return model if ":" in model else model + ":latest"
+
+
+class ModelManager:
+    """
+    Keeps OLLAMA_MODEL loaded. warm() checks in a background thread whether
+    the model is resident (ollama ps) and loads it with an empty prompt if not.
+    """
+    def __init__(self, model, keep_alive="30m", host=None):
+        """
+        Args:
+            model (str): Ollama model name.
+            keep_alive (str|int): Residency policy, sent with the preload and with
+                every chat request (e.g. "30m", or -1 to never unload).
+            host (str): Ollama server URL (None = default).
+        """
+        self.model = model
+        self.keep_alive = keep_alive
+        self.keep_alive_s = keep_alive_seconds(keep_alive)
+        self.expires_at = None  # time.monotonic() du dechargement prevu par Ollama
+        self._expiry_timer = None
+        self.client = ollama.Client(host=host)
+        self.state = UNLOADED
+        self.load_time = 0.0  # Duree du dernier chargement, en secondes
+        self._lock = threading.Lock()
+        self._thread = None
+        self._listeners = []
+
+    def subscribe(self, callback):
+        """Registers callback(state); it is called at once with the current state."""
+        with self._lock:
+            self._listeners.append(callback)
+            state = self.state
+        callback(state)
+
+    def _set_state(self, state):
+        with self._lock:
+            if state == self.state:
+                return
+            self.state = state
+            listeners = list(self._listeners)
+        for callback in listeners:
+            callback(state)
+
+    def _schedule_expiry(self, seconds=None):
+        """
+        Ollama unloads the model keep_alive after the last request: the
+        state goes back to UNLOADED at that time, even while idle.
+        Args:
+            seconds (float): Time left before unloading (default: keep_alive).
+        """
+        if seconds is None:
+            seconds = self.keep_alive_s
+        with self._lock:
+            if self._expiry_timer is not None:
+                self._expiry_timer.cancel()
+                self._expiry_timer = None
+            if seconds is None:
+                self.expires_at = None
+                return
+            self.expires_at = time.monotonic() + seconds
+            self._expiry_timer = threading.Timer(max(0.0, seconds) + 1.0, self._expire)
+            self._expiry_timer.daemon = True
+            self._expiry_timer.start()
+
+    def _expire(self):
+        with self._lock:
+            expired = self.expires_at is not None and time.monotonic() >= self.expires_at
+        if expired and self.state == READY:
+            self._set_state(UNLOADED)
+
+    def _loaded_entry(self):
+        """The model's entry in 'ollama ps', or None if it is not loaded."""
+        name = _full_name(self.model)
+        for m in self.client.ps()['models']:
+            if m['model'] == name:
+                return m
+        return None
+
+    @staticmethod
+    def _seconds_left(entry):
+        """Time before Ollama unloads the model, from its 'expires_at' (None if unknown)."""
+        expires = entry.get('expires_at')
+        if isinstance(expires, str):
+            try:
+                expires = datetime.datetime.fromisoformat(expires.replace("Z", "+00:00"))
+            except ValueError:
+                return None
+        if not isinstance(expires, datetime.datetime) or expires.tzinfo is None:
+            return None
+        left = (expires - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+        # Annee tres lointaine : keep_alive negatif, jamais decharge
+        return None if left > 365 * 24 * 3600 else left
+
+    def _warm(self):
+        try:
+            entry = self._loaded_entry()
+            if entry is not None:
+                # Deja en memoire : echeance de dechargement donnee par Ollama
+                self._schedule_expiry(self._seconds_left(entry))
+                self._set_state(READY)
+                return
+            self._set_state(LOADING)
+            start = time.monotonic()
+            # Prompt vide : Ollama charge le modele sans rien generer
+            self.client.generate(model=self.model, prompt="", keep_alive=self.keep_alive)
+            self.load_time = time.monotonic() - start
+            print(f"Modele {self.model} charge en {self.load_time:.1f}s")
+            self._schedule_expiry()
+            self._set_state(READY)
+        except Exception as e:
+            print(f"Erreur de chargement du modele : {e}")
+            self._set_state(ERROR)
+
+    def warm(self):
+        """
+        Makes sure the model is (being) loaded, without blocking.
+        Does nothing if a check or a load is already in progress.
+        """
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._warm, daemon=True)
+            self._thread.start()
+
+    def mark_used(self):
+        """A chat request just completed: the model is resident for another keep_alive."""
+        self._schedule_expiry()
+        self._set_state(READY)
@@ -0,0 +1,111 @@
+# Description:
+# Calcul de l'orientation des ecrans ST7789 / ST7735S.
+# A partir du MADCTL de base d'un ecran (celui valide sur le materiel, avec ses
+# col_start/row_start) et d'une rotation demandee, on determine les bits MX/MY/MV
+# et les offsets de fenetre qui donnent le meme resultat qu'une rotation logicielle
+# de l'image, sans aucun travail par trame.
+
+# Bits MADCTL (Memory Access Control)
+MADCTL_MY = 0x80  # Row address order
+MADCTL_MX = 0x40  # Column address order
+MADCTL_MV = 0x20  # Row/column exchange
+MADCTL_ORIENTATION_BITS = MADCTL_MY | MADCTL_MX | MADCTL_MV
+
+# Taille de la GRAM (largeur, hauteur natives) selon le controleur
+GRAM_SIZE = {
+    "st7789": (240, 320),
+    "st7735s": (132, 162),
+}
+
+
+def _native_map(madctl, native_w, native_h, x, y):
+    """Maps a logical pixel to the panel's native (unmirrored) coordinates."""
+    a, b = (y, x) if madctl & MADCTL_MV else (x, y)
+    nx = native_w - 1 - a if madctl & MADCTL_MX else a
+    ny = native_h - 1 - b if madctl & MADCTL_MY else b
+    return nx, ny
+
+
+def _rotate_point(angle, w, h, x, y):
+    """
+    Position of pixel (x, y) of a w x h image after a counter-clockwise
+    rotation by 'angle' (same convention as PIL's Image.rotate, with expand).
+    """
+    if angle == 90:
+        return y, w - 1 - x
+    if angle == 180:
+        return w - 1 - x, h - 1 - y
+    if angle == 270:
+        return h - 1 - y, x
+    return x, y
+
+
+def _logical_size(madctl, native_w, native_h):
+    return (native_h, native_w) if madctl & MADCTL_MV else (native_w, native_h)
+
+
+def _offsets(madctl, gram_w, gram_h, native_w, native_h, ox, oy):
+    """Window offsets (col_start, row_start) for 'madctl', from native offsets."""
+    x = gram_w - native_w - ox if madctl & MADCTL_MX else ox
+    y = gram_h - native_h - oy if madctl & MADCTL_MY else oy
+    return (y, x) if madctl & MADCTL_MV else (x, y)
+
+
+def resolve_orientation(config):
+    """
+    Works out the MADCTL value and window geometry for a panel config.
+    Args:
+        config (dict): A panel dictionary from waveshare_config.py. 'madctl',
+            'width', 'height', 'col_start' and 'row_start' describe the base
+            orientation; 'rotation' (degrees, counter-clockwise) is applied on top.
+    Returns:
+        dict with 'madctl', 'width', 'height', 'col_start' and 'row_start'.
+    Raises:
+        ValueError: if 'rotation' is not a multiple of 90 degrees (MADCTL
+            cannot express it).
+    """
+    base = config['madctl']
+    angle = config.get('rotation', 0) % 360
+    if angle % 90:
+        raise ValueError(f"{config.get('name', 'Ecran')} : rotation {config['rotation']} "
+                         f"non multiple de 90 degres, non exprimable par MADCTL")
+    gram_w, gram_h = GRAM_SIZE[config.get('controller', 'st7789')]
+    col_start = config.get('col_start', 0)
+    row_start = config.get('row_start', 0)
+
+    # Taille et offsets natifs de la zone visible, deduits de l'orientation de base
+    native_w, native_h = _logical_size(base, config['width'], config['height'])
+    nx, ny = (row_start, col_start) if base & MADCTL_MV else (col_start, row_start)
+    ox = gram_w - native_w - nx if base & MADCTL_MX else nx
+    oy = gram_h - native_h - ny if base & MADCTL_MY else ny
+
+    result = {
+        'madctl': base,
+        'width': config['width'],
+        'height': config['height'],
+        'col_start': col_start,
+        'row_start': row_start,
+    }
+    if angle == 0:
+        return result
+
+    base_w, base_h = config['width'], config['height']
+    for bits in (0x00, MADCTL_MX, MADCTL_MY, MADCTL_MX | MADCTL_MY,
+                 MADCTL_MV, MADCTL_MV | MADCTL_MX, MADCTL_MV | MADCTL_MY, MADCTL_MV | MADCTL_MX | MADCTL_MY):
+        madctl = (base & ~MADCTL_ORIENTATION_BITS & 0xFF) | bits
+        w, h = _logical_size(madctl, native_w, native_h)
+        if angle in (90, 270) and (w, h) != (base_h, base_w):
+            continue
+        if angle == 180 and (w, h) != (base_w, base_h):
+            continue
+        # Le pixel (x, y) doit atterrir la ou la rotation logicielle l'aurait mis
+        corners = ((0, 0), (w - 1, 0), (0, h - 1), (w - 1, h - 1))
+        if all(_native_map(madctl, native_w, native_h, x, y)
+               == _native_map(base, native_w, native_h, *_rotate_point(angle, w, h, x, y))
+               for x, y in corners):
+            cs, rs = _offsets(madctl, gram_w, gram_h, native_w, native_h, ox, oy)
+            result.update(madctl=madctl, width=w, height=h, col_start=cs, row_start=rs)
+            return result
+
+    # Les 8 combinaisons MX/MY/MV couvrent toutes les rotations de 90 degres
+    raise ValueError(f"Aucun MADCTL ne donne la rotation {angle} pour la base {base:#04x}")
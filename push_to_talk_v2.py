@@ -1,10 +1,11 @@
 import time
 import os
 import threading
-import RPi.GPIO as GPIO
-import speech_recognition as sr
-import pyaudio
-import wave
+import asyncio
+import functools
+import traceback
+from collections import OrderedDict
+from hardware import GPIO, pyaudio, spidev, SIMULATED
 import ollama
 from PIL import Image, ImageDraw, ImageFont
 import textwrap
@@ -12,37 +13,170 @@ import textwrap
 # Import local drivers
 from waveshare_config import LCD_1_3, LCD_0_96_1, LCD_0_96_2, KEYS
 from display import ST7789
+from buttons import Buttons
+from display_service import DisplayService
+from ui_state import UiStore
+from conversation import Conversation
+from response_cache import ResponseCache
+from turn_trace import TurnTrace, TraceSink
+from model_manager import ModelManager, UNLOADED, LOADING, READY, ERROR
+from strip import StreamingStrip, TiledStrip
+from rgb565 import image_to_rgb565
+from text_layout import wrap_text_pixel, line_width
+from transcriber import make_transcriber
+from audio_capture import AudioBuffer, AudioDevice, VoiceActivityDetector, TARGET_RATE
 
 # --- CONFIGURATION ---
 RECORD_PIN = KEYS['KEY2']
 VALIDATE_PIN = KEYS['KEY1']
 OLLAMA_MODEL = "llama3.2:latest"
-TEMP_AUDIO_FILE = "/tmp/recording.wav"
+OLLAMA_KEEP_ALIVE = "30m"  # Duree de residence du modele apres chaque requete (-1 = toujours)
+MAX_RECORD_SECONDS = 30.0  # Duree max d'un enregistrement (tampon en memoire)
+AUDIO_DEVICE_INDEX = None  # None = micro par defaut
+PREROLL_MS = 300  # Audio garde avant l'appui sur K2
+BUTTON_DEBOUNCE_MS = 20
+
+# Backend de transcription : "google" (web), "vosk" (local, hors-ligne) ou "fake"
+TRANSCRIBER = "google"
+TRANSCRIBER_OPTIONS = {
+    "google": {"language": "fr-FR"},
+    "vosk": {"model_path": "/home/pi/models/vosk-model-small-fr-0.22"},
+    "fake": {},
+}
+
+# Detection d'activite vocale (VAD) : niveau RMS (echelle int16) et marges gardees
+VAD_THRESHOLD = 500.0
+VAD_HANGOVER_MS = 300
+VAD_MIN_SPEECH_MS = 150
 STATIC_HOLD_SECONDS = 3.0
 SCROLL_SPEED = 0.8
+SIDE_FRAME_CACHE_SIZE = 32
+STREAM_RENDER_INTERVAL = 0.15  # Rendu max ~7 fois/s pendant le streaming Ollama
+
+# Memoire de conversation : le prompt systeme ne doit pas changer (cache KV d'Ollama)
+SYSTEM_PROMPT = 'Tu es Iana, un assistant concis et efficace. Réponds en français.'
+CONVERSATION_TOKEN_BUDGET = 1024  # Prompt systeme + historique + question (estimation)
+CONVERSATION_IDLE_SECONDS = 300.0  # Historique efface apres 5 min sans echange
+
+# Cache persistant des reponses : seules les reponses obtenues sans historique sont
+# enregistrees, mais une question deja posee est servie quel que soit l'historique
+RESPONSE_CACHE_ENABLED = True  # False : toujours interroger le LLM
+RESPONSE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "responses.sqlite")
+RESPONSE_CACHE_TTL = 7 * 24 * 3600.0
+RESPONSE_CACHE_MAX_ENTRIES = 500
+ANSWER_STRIP_CACHE_SIZE = 8  # Bandes deja rendues gardees en memoire pour les reponses en cache
+
+# Textes connus des ecrans lateraux, pre-rendus au demarrage
+SIDE_SCREEN_TEXTS = [
+    "Maintenez K2 pour parler", "IDLE",
+    "Enregistrement...", "RECORDING",
+    "Transcription...", "PROCESSING",
+    "Validez votre texte", "VALIDATE",
+    "Iana réfléchit...", "THINKING",
+    "Modele non charge", "Chargement du modele...", "Modele pret", "Modele indisponible",
+]
+
+# Textes des ecrans lateraux pour chaque etat de l'assistant
+SIDE_SCREEN_STATES = {
+    "IDLE": ("Maintenez K2 pour parler", "IDLE"),
+    "RECORDING": ("Enregistrement...", "RECORDING"),
+    "PROCESSING": ("Transcription...", "PROCESSING"),
+    "VALIDATE": ("Validez votre texte", "VALIDATE"),
+    "THINKING": ("Iana réfléchit...", "THINKING"),
+}
+
+# Etat du modele Ollama, affiche sur l'ecran lateral droit
+MODEL_STATUS_TEXTS = {
+    UNLOADED: "Modele non charge",
+    LOADING: "Chargement du modele...",
+    READY: "Modele pret",
+    ERROR: "Modele indisponible",
+}
+
+# Trace des latences par tour : journal JSONL tournant + fichier texte Prometheus
+# (a pointer vers le dossier du collecteur textfile de node_exporter, ou None)
+TRACE_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "turns.jsonl")
+TRACE_LOG_MAX_BYTES = 1 << 20
+TRACE_LOG_BACKUPS = 3
+TRACE_PROM_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "iana.prom")
+
+# Materiel simule (IANA_HARDWARE=sim) : scenario de boutons joue au demarrage,
+# (delai depuis l'etape precedente, broche, appui), et dossier des captures d'ecran
+SIM_BUTTON_SCRIPT = [
+    (3.0, RECORD_PIN, True), (4.0, RECORD_PIN, False),  # Question de 4 s
+    (3.0, VALIDATE_PIN, True), (0.1, VALIDATE_PIN, False),  # Validation
+]
+SIM_PNG_DIR = "/tmp/iana_sim"
 
 # --- INIT HARDWARE ---
-print("Initialisation des ecrans...")
-LCD_1_3['rotation'] = 180
-disp = ST7789(LCD_1_3)
-disp_side1 = ST7789(LCD_0_96_1)
-disp_side2 = ST7789(LCD_0_96_2)
-
-GPIO.setmode(GPIO.BCM)
-GPIO.setup(RECORD_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-GPIO.setup(VALIDATE_PIN, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+# Initialises par init_displays() / init_services(), appeles par main() : importer ce
+# module (bench.py) n'ouvre ni micro, ni connexion Ollama, ni fichiers.
+disp = disp_side1 = disp_side2 = None
+display_service = None
+model_manager = None
+response_cache = None
+trace_sink = None
+transcriber = None
+audio_device = None
+buttons = None
+
+def init_displays():
+    """Opens the three panels and starts one SPI writer thread per bus."""
+    global disp, disp_side1, disp_side2, display_service
+
+    print("Initialisation des ecrans...")
+    LCD_1_3['rotation'] = 180
+    disp = ST7789(LCD_1_3)
+    disp_side1 = ST7789(LCD_0_96_1)
+    disp_side2 = ST7789(LCD_0_96_2)
+
+    # Un thread d'ecriture par bus SPI (SPI1 : centre, SPI0 : ecrans lateraux)
+    display_service = DisplayService([disp, disp_side1, disp_side2])
+    display_service.start()
+
+def init_services():
+    """Model preload, caches, transcription backend, microphone and buttons."""
+    global model_manager, response_cache, trace_sink, transcriber, audio_device, buttons
+
+    # Prechargement du LLM en arriere-plan, pendant le reste de l'init
+    print(f"Prechargement du modele {OLLAMA_MODEL}...")
+    model_manager = ModelManager(OLLAMA_MODEL, OLLAMA_KEEP_ALIVE)
+    model_manager.warm()
+
+    response_cache = ResponseCache(RESPONSE_CACHE_PATH, OLLAMA_MODEL, SYSTEM_PROMPT,
+                                   ttl=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES,
+                                   enabled=RESPONSE_CACHE_ENABLED)
+
+    trace_sink = TraceSink(TRACE_LOG_PATH, TRACE_PROM_PATH, TRACE_LOG_MAX_BYTES, TRACE_LOG_BACKUPS)
+
+    # Modele de transcription charge une seule fois, et garde en memoire
+    print(f"Chargement du backend de transcription : {TRANSCRIBER}...")
+    transcriber = make_transcriber(TRANSCRIBER, **TRANSCRIBER_OPTIONS.get(TRANSCRIBER, {}))
+
+    # Micro ouvert une seule fois et garde actif (pre-roll)
+    print("Ouverture du micro...")
+    audio_device = AudioDevice(pyaudio, AUDIO_DEVICE_INDEX, preroll_ms=PREROLL_MS)
+    audio_device.open()
+
+    # Boutons par interruptions (fronts GPIO -> file d'evenements)
+    buttons = Buttons([RECORD_PIN, VALIDATE_PIN], bouncetime_ms=BUTTON_DEBOUNCE_MS)
 
 # --- GLOBAL STATE ---
-state = "IDLE"
-user_text = ""
-bot_text = "Bonjour. Je suis Iana."
-scroll_y = 0.0
-bot_strip = None
+WELCOME_TEXT = "Bonjour. Je suis Iana."
 running = True
-lock = threading.Lock()
-last_bot_update_time = 0.0
+
+# Etat de l'interface, publie au thread d'affichage (voir ui_state.py)
+ui = UiStore("IDLE")
+
+# Bandes des reponses en cache, par cle de cache (tuiles deja rendues)
+answer_strips = OrderedDict()
+
+# Cache des trames RGB565 des ecrans lateraux
+side_frame_cache = OrderedDict()
+side_cache_lock = threading.Lock()
 
 # --- FONTS ---
+@functools.lru_cache(maxsize=None)
 def get_font(size):
     try:
         # Chemin standard sur Raspberry Pi
@@ -50,40 +184,6 @@ def get_font(size):
     except:
         return ImageFont.load_default()
 
-def wrap_text_pixel(text, font, width):
-    """
-    Wraps text based on pixel width, not character count.
-    Returns a list of lines.
-    """
-    words = text.split()
-    if not words:
-        return []
-
-    lines = []
-    current_line = words[0]
-    
-    # We need a dummy drawable to measure text without creating a new image every time
-    dummy_img = Image.new('RGB', (1, 1))
-    dummy_draw = ImageDraw.Draw(dummy_img)
-
-    for word in words[1:]:
-        # Check width of the line with the new word
-        test_line = f"{current_line} {word}"
-        bbox = dummy_draw.textbbox((0, 0), test_line, font=font)
-        w = bbox[2] - bbox[0]
-        
-        if w > width:
-            # The new word makes the line too long, so save the current line
-            lines.append(current_line)
-            current_line = word
-        else:
-            # The new word fits, so add it to the current line
-            current_line = test_line
-    
-    # Add the last remaining line
-    lines.append(current_line)
-    return lines
-
 font_ui = get_font(16)
 font_text = get_font(16)
 font_sm = get_font(12)
@@ -92,8 +192,9 @@ font_large = get_font(24)
 # --- UI LOGIC ---
 def create_bot_strip(text, width, height, font):
     """
-    Creates an image strip for the main display.
-    Returns a static image if text fits, or a long scrolling strip if it doesn't.
+    Creates the strip for the main display.
+    Returns a static, centered strip if text fits, or a long scrolling strip if it doesn't.
+    Only the text layout is done here: tiles are rendered on demand (see TiledStrip).
     """
     # Use a 10px margin for the text
     lines = wrap_text_pixel(text, font, width - 10)
@@ -104,196 +205,584 @@ def create_bot_strip(text, width, height, font):
 
     # --- CONDITIONAL LOGIC ---
     if total_h <= height:
-        # Text fits, create a static, centered image
-        img = Image.new('RGB', (width, height), (0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        y = (height - total_h) / 2 # Center the whole block
-        for line in lines:
-            draw.text((5, y), line, font=font, fill=(255, 255, 255))
-            y += line_h
-        return img
+        # Text fits: a single tile, the whole block centered
+        return TiledStrip(lines, width, height, font, line_h, (height - total_h) / 2,
+                          tile_h=height, max_tiles=1)
     else:
         # Text overflows, create a long scrolling strip
         # Add padding at the bottom so the last line can scroll to the top
         strip_h = total_h + height - line_h
-        img = Image.new('RGB', (width, strip_h), (0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        y = 5 # Small top padding
-        for line in lines:
-            draw.text((5, y), line, font=font, fill=(255, 255, 255))
-            y += line_h
-        return img
+        return TiledStrip(lines, width, strip_h, font, line_h, 5) # Small top padding
 
 def update_bot_text(text):
-    global bot_text, bot_strip, scroll_y, last_bot_update_time
-    with lock:
-        bot_text = text
-        # Pass dimensions and font to the strip creator
-        bot_strip = create_bot_strip(text, disp.width, disp.height, font_text)
-        scroll_y = 0.0
-        last_bot_update_time = time.time()
+    # Pass dimensions and font to the strip creator
+    # (tuiles RGB565 rendues a la demande : chaque trame n'est qu'une tranche)
+    strip = create_bot_strip(text, disp.width, disp.height, font_text)
+    show_strip(strip)
+    return strip
+
+def show_strip(strip):
+    """Publishes an already built strip (streaming or cached answer) to the display thread."""
+    ui.update(bot_strip=strip, strip_time=time.time())
+
+def remember_answer_strip(key, strip):
+    """Keeps the strip of a cached answer, so a hit reuses its rendered tiles."""
+    answer_strips[key] = strip
+    answer_strips.move_to_end(key)
+    if len(answer_strips) > ANSWER_STRIP_CACHE_SIZE:
+        answer_strips.popitem(last=False)
+
+def render_side_frame(text, display, font):
+    """
+    Renders a side-panel status frame and returns it encoded to RGB565.
+    Frames are memoized by text, font and panel geometry (bounded LRU).
+    """
+    # Police bitmap de repli (load_default) : ni 'path' ni 'size'
+    key = (text, getattr(font, 'path', id(font)), getattr(font, 'size', None),
+           display.width, display.height)
+    with side_cache_lock:
+        data = side_frame_cache.get(key)
+        if data is not None:
+            side_frame_cache.move_to_end(key)
+            return data
+
+    img = Image.new('RGB', (display.width, display.height), (0, 0, 0))
+    draw = ImageDraw.Draw(img)
 
-def update_side_screens(text_left, text_right):
-    # Font for side screens - smaller
-    font = get_font(18)
-    
-    # --- Process left screen ---
-    img1 = Image.new('RGB', (disp_side1.width, disp_side1.height), (0, 0, 0))
-    draw1 = ImageDraw.Draw(img1)
-    
     # Use the new reliable wrapper with a small margin
-    lines1 = wrap_text_pixel(text_left, font, disp_side1.width - 10)
-    
+    lines = wrap_text_pixel(text, font, display.width - 10)
+
     # Calculate total height to center the text block
     line_h = (font.getbbox("Mg")[3] - font.getbbox("Mg")[1]) + 2 # Get real line height
-    total_h = len(lines1) * line_h
-    y1 = (disp_side1.height - total_h) / 2
-    
-    for line in lines1:
-        bbox = draw1.textbbox((0, 0), line, font=font)
-        w = bbox[2] - bbox[0]
-        x = (disp_side1.width - w) / 2 # Center each line horizontally
-        draw1.text((x, y1), line, font=font, fill=(255, 255, 255))
-        y1 += line_h
-    disp_side1.display(img1)
-
-    # --- Process right screen (same logic) ---
-    img2 = Image.new('RGB', (disp_side2.width, disp_side2.height), (0, 0, 0))
-    draw2 = ImageDraw.Draw(img2)
-    lines2 = wrap_text_pixel(text_right, font, disp_side2.width - 10)
-    
-    total_h_2 = len(lines2) * line_h
-    y2 = (disp_side2.height - total_h_2) / 2
-    
-    for line in lines2:
-        bbox = draw2.textbbox((0, 0), line, font=font)
-        w = bbox[2] - bbox[0]
-        x = (disp_side2.width - w) / 2
-        draw2.text((x, y2), line, font=font, fill=(255, 255, 255))
-        y2 += line_h
-    disp_side2.display(img2)
+    total_h = len(lines) * line_h
+    y = (display.height - total_h) / 2
+
+    for line in lines:
+        w = line_width(line, font)
+        x = (display.width - w) / 2 # Center each line horizontally
+        draw.text((x, y), line, font=font, fill=(255, 255, 255))
+        y += line_h
+
+    data = image_to_rgb565(img)
+    with side_cache_lock:
+        side_frame_cache[key] = data
+        if len(side_frame_cache) > SIDE_FRAME_CACHE_SIZE:
+            side_frame_cache.popitem(last=False)
+    return data
+
+def prewarm_side_frames():
+    """Renders every known status string in advance for both side panels."""
+    font = get_font(18)
+    for text in SIDE_SCREEN_TEXTS:
+        render_side_frame(text, disp_side1, font)
+        render_side_frame(text, disp_side2, font)
 
-def display_thread_func():
-    global scroll_y, running, last_bot_update_time
-    
-    # On fait le premier rendu du message d'accueil
-    update_bot_text(bot_text)
-    
-    while running:
-        start_time = time.time()
-        
-        with lock:
-            curr_state = state
-            curr_user = user_text
-            curr_strip = bot_strip
-            curr_scroll = scroll_y
-            last_update = last_bot_update_time
-        
-        img = Image.new('RGB', (disp.width, disp.height), (0, 0, 0))
-        draw = ImageDraw.Draw(img)
-        
-        if curr_state == "VALIDATE":
+def update_side_screens(text_left, text_right):
+    # Font for side screens - smaller
+    font = get_font(18)
+    display_service.submit_rgb565(disp_side1, [render_side_frame(text_left, disp_side1, font)])
+    display_service.submit_rgb565(disp_side2, [render_side_frame(text_right, disp_side2, font)])
+
+class DisplayLoop:
+    """
+    Main display refresh (~20 FPS). frame() draws one frame from the latest
+    UiStore snapshot; run() calls it in a loop until 'running' is cleared.
+    """
+    def __init__(self):
+        # Abonnement a l'etat de l'interface : on garde le dernier instantane recu
+        self.snap = None
+        ui.subscribe(self._on_snapshot)
+
+        # Position de scroll (propre a ce thread) et bande a laquelle elle se rapporte
+        self.scroll_y = 0.0
+        self.scroll_strip = None
+        self.last_update = 0.0
+
+        # Strip statique deja envoyee a l'ecran (inutile de la renvoyer)
+        self.static_sent = None
+
+    def _on_snapshot(self, snap):
+        self.snap = snap
+
+    def frame(self):
+        snap = self.snap
+        curr_state = snap.state
+        curr_user = snap.user_text
+        curr_strip = snap.bot_strip
+        if curr_strip is not self.scroll_strip:
+            # Nouvelle bande : on repart du haut
+            self.scroll_strip = curr_strip
+            self.scroll_y = 0.0
+            self.last_update = snap.strip_time
+
+        img = None
+        frame_sent = False
+
+        if curr_state == "VALIDATE" or (curr_state == "RECORDING" and curr_user):
             # --- LAYOUT VALIDATION ---
+            # (aussi utilise pour la transcription partielle pendant l'enregistrement)
+            img = Image.new('RGB', (disp.width, disp.height), (0, 0, 0))
+            draw = ImageDraw.Draw(img)
+
             # Utilise le nouveau wrapper pour le texte utilisateur
             lines_user = wrap_text_pixel(curr_user, font_text, disp.width - 20)
-            
+
             line_h = font_text.getbbox("Mg")[3] - font_text.getbbox("Mg")[1] + 4
             total_h = len(lines_user) * line_h
-            
+
             # Centre le bloc de texte verticalement, un peu vers le haut
             uy = (disp.height - total_h) / 2 - 20
-            
+
             for line in lines_user:
-                bbox = draw.textbbox((0, 0), line, font=font_text)
-                w = bbox[2] - bbox[0]
+                w = line_width(line, font_text)
                 # Centre chaque ligne horizontalement
                 draw.text(((disp.width - w) / 2, uy), line, font=font_text, fill=(100, 255, 255))
                 uy += line_h
 
             # Aide pour la validation en bas
-            help_text = "K1: Valider | K2: Annuler"
-            bbox = draw.textbbox((0, 0), help_text, font=font_ui)
-            w = bbox[2] - bbox[0]
+            if curr_state == "VALIDATE":
+                help_text = "K1: Valider | K2: Annuler"
+            else:
+                help_text = "Relachez K2 pour finir"
+            w = line_width(help_text, font_ui)
             draw.text(((disp.width - w) / 2, disp.height - 30), help_text, font=font_ui, fill=(255, 255, 0))
 
         elif curr_strip:
             # --- DYNAMIC DISPLAY LOGIC (STATIC OR SCROLL) ---
             is_scrolling = curr_strip.height > disp.height
 
-            if not is_scrolling:
-                # It's a static image, just paste it
-                img.paste(curr_strip, (0, 0))
+            if curr_strip.follow:
+                # Reponse en cours de streaming : on suit la fin du texte
+                # (chaque rendu publie une nouvelle bande, envoyee une seule fois)
+                if self.static_sent is not curr_strip:
+                    sy = max(0, curr_strip.content_height - disp.height)
+                    display_service.submit_rgb565(disp, curr_strip.viewport(sy, disp.height))
+                    self.static_sent = curr_strip
+                frame_sent = True
+            elif not is_scrolling:
+                # It's a static strip, send it once
+                if self.static_sent is not curr_strip:
+                    display_service.submit_rgb565(disp, curr_strip.viewport(0, curr_strip.height))
+                    self.static_sent = curr_strip
+                frame_sent = True
             else:
                 # It's a scrolling strip
                 area_h = disp.height
-                sy = int(curr_scroll)
+                sy = int(self.scroll_y)
 
                 # If we've scrolled to the end, pause and then loop back
                 if sy >= curr_strip.height - area_h:
                     time.sleep(1.5)  # Pause at the end before looping
-                    with lock:
-                        scroll_y = 0.0
-                        # Reset the timer to enforce the static hold again on loop
-                        last_bot_update_time = time.time()
+                    self.scroll_y = 0.0
+                    # Reset the timer to enforce the static hold again on loop
+                    self.last_update = time.time()
                     sy = 0  # Use 0 for this frame's render
 
-                crop = curr_strip.crop((0, sy, disp.width, sy + area_h))
-                img.paste(crop, (0, 0))
+                # Tranche memoryview des lignes visibles, sans copie
+                display_service.submit_rgb565(disp, curr_strip.viewport(sy, area_h))
+                self.static_sent = None
+                frame_sent = True
 
                 # Increment scroll position only after the hold time has passed
-                if time.time() - last_update > STATIC_HOLD_SECONDS:
-                    with lock:
-                        scroll_y += SCROLL_SPEED
+                if time.time() - self.last_update > STATIC_HOLD_SECONDS:
+                    self.scroll_y += SCROLL_SPEED
+
+        if not frame_sent:
+            if img is None:
+                img = Image.new('RGB', (disp.width, disp.height), (0, 0, 0))
+            self.static_sent = None
+            display_service.submit(disp, img)
 
-        disp.display(img)
-            
-        # Regulation FPS (~20 FPS)
-        elapsed = time.time() - start_time
-        if elapsed < 0.05:
-            time.sleep(0.05 - elapsed)
+    def run(self):
+        while running:
+            start_time = time.time()
+            self.frame()
+
+            # Regulation FPS (~20 FPS)
+            elapsed = time.time() - start_time
+            if elapsed < 0.05:
+                time.sleep(0.05 - elapsed)
+
+def display_thread_func():
+    DisplayLoop().run()
 
 # --- AUDIO LOGIC ---
-def record_audio_hold():
-    CHUNK = 1024
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-    RATE = 44100
-    
-    p = pyaudio.PyAudio()
-    try:
-        stream = p.open(format=FORMAT, channels=CHANNELS, rate=RATE, input=True, frames_per_buffer=CHUNK)
-    except:
-        return False
+def record_audio_hold(stop_event, on_chunk=None, trace=None):
+    """
+    Records until 'stop_event' is set (K2 release edge), into memory, at TARGET_RATE (16 kHz).
+    The recording starts with the device's pre-roll (last ~300 ms before the press).
+    Leading and trailing silence is trimmed; the AudioData is empty when
+    no speech was detected.
+    Args:
+        stop_event (threading.Event): Set by the orchestrator when K2 is released.
+        on_chunk (callable): Optional, called with each 16 kHz chunk while
+            recording (e.g. StreamingSession.feed).
+        trace (TurnTrace): Optional, gets the 'capture_start' mark.
+    Returns a speech_recognition AudioData, or None if the mic is unavailable.
+    """
+    if not audio_device.start_capture():
+        return None
+    if trace is not None:
+        trace.mark("capture_start")
+
+    buf = AudioBuffer(TARGET_RATE, audio_device.sample_width, 1, max_seconds=MAX_RECORD_SECONDS)
+    vad = VoiceActivityDetector(TARGET_RATE, audio_device.sample_width, VAD_THRESHOLD,
+                                VAD_HANGOVER_MS, VAD_MIN_SPEECH_MS)
+    # S'arrete sur le front de relachement de K2
+    while not stop_event.is_set():
+        data = audio_device.read()
+        if data is None:
+            continue # Micro en cours de reouverture
+        vad.feed(data)
+        if on_chunk is not None:
+            on_chunk(data)
+        if not buf.append(data):
+            break # Duree max atteinte
+
+    audio_device.stop_capture()
+
+    # Suppression des silences de debut et de fin
+    total = buf.duration
+    bounds = vad.speech_bounds()
+    if bounds is None:
+        buf.trim(0, 0)
+    else:
+        buf.trim(*bounds)
+    print(f"VAD : {total - buf.duration:.2f}s de silence coupes sur {total:.2f}s")
 
-    frames = []
-    while GPIO.input(RECORD_PIN) == GPIO.LOW:
-        data = stream.read(CHUNK, exception_on_overflow=False)
-        frames.append(data)
-    
-    stream.stop_stream()
-    stream.close()
-    p.terminate()
-
-    wf = wave.open(TEMP_AUDIO_FILE, 'wb')
-    wf.setnchannels(CHANNELS)
-    wf.setsampwidth(p.get_sample_size(FORMAT))
-    wf.setframerate(RATE)
-    wf.writeframes(b''.join(frames))
-    wf.close()
-    return True
-
-def transcribe_audio():
-    recognizer = sr.Recognizer()
-    with sr.AudioFile(TEMP_AUDIO_FILE) as source:
-        audio_data = recognizer.record(source)
-        try:
-            return recognizer.recognize_google(audio_data, language="fr-FR")
-        except:
+    return buf.to_audio_data()
+
+def transcribe_audio(audio_data, session=None):
+    """
+    Returns the transcript of 'audio_data'. With a streaming session (fed
+    during the recording), only the final flush is left to do.
+    """
+    if session is not None:
+        if not audio_data.frame_data:
+            session.cancel()
             return None
+        txt = session.finish()
+        print(f"Transcription ({transcriber.name}, streaming) : {transcriber.last_latency:.2f}s")
+        return txt
+
+    if not audio_data.frame_data:
+        # Rien au-dessus du bruit de fond : inutile d'appeler le recognizer
+        return None
+    txt = transcriber.transcribe(audio_data)
+    print(f"Transcription ({transcriber.name}) : {transcriber.last_latency:.2f}s")
+    return txt
+
+# --- ORCHESTRATION ---
+class Assistant:
+    """
+    State machine of the assistant (IDLE -> RECORDING -> PROCESSING -> VALIDATE
+    -> THINKING), driven by an asyncio event loop.
+    Every input is an event: button edges, end of recording, transcript and
+    partial transcripts. Blocking calls (recording, recognizer) run in executor
+    threads and post their result back as events. The LLM answer is streamed
+    by an asyncio task (ollama.AsyncClient) that K2 can cancel at any time.
+    """
+    def __init__(self):
+        self.loop = None
+        self.events = None
+        self.state = "IDLE"
+        self.record_stop = None
+        self.session = None
+        self.builder = None
+        self.last_render = 0.0
+        self.llm_client = None
+        self.llm_task = None
+        self.prompt = ""
+        self.cacheable = False
+        self.trace = None
+        self.overflows_start = 0
+        self.conversation = Conversation(SYSTEM_PROMPT, CONVERSATION_TOKEN_BUDGET,
+                                         CONVERSATION_IDLE_SECONDS)
+
+    # --- Plomberie evenements ---
+    def post(self, kind, payload=None):
+        """Thread-safe: queues an event for the loop."""
+        self.loop.call_soon_threadsafe(self.events.put_nowait, (kind, payload))
+
+    def _call(self, func, args, done):
+        try:
+            self.post(done, func(*args))
+        except Exception as e:
+            self.post(done + "_error", e)
+
+    def run_blocking(self, func, *args, done):
+        """Runs func(*args) in the executor; its result comes back as event 'done'."""
+        self.loop.run_in_executor(None, self._call, func, args, done)
+
+    def set_state(self, new_state, **changes):
+        self.state = new_state
+        ui.update(state=new_state, **changes)
+        self.update_side_screens()
+
+    def update_side_screens(self):
+        text_left, text_right = SIDE_SCREEN_STATES[self.state]
+        # Etat du modele a droite au repos, ou tant qu'il n'est pas pret
+        if self.state == "IDLE" or model_manager.state != READY:
+            text_right = MODEL_STATUS_TEXTS[model_manager.state]
+        update_side_screens(text_left, text_right)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.events = asyncio.Queue()
+        self.llm_client = ollama.AsyncClient()
+        buttons.subscribe(lambda ev: self.post("button", ev))
+        self.set_state("IDLE")
+        model_manager.subscribe(lambda model_state: self.post("model", model_state))
+
+        try:
+            while True:
+                kind, payload = await self.events.get()
+                self.dispatch(kind, payload)
+        finally:
+            # Arret : on libere l'enregistrement en cours, sinon l'arret de
+            # l'executor attendrait indefiniment record_audio_hold
+            if self.record_stop is not None:
+                self.record_stop.set()
+
+    def dispatch(self, kind, payload):
+        """Calls on_<kind>; an exception in a handler brings the assistant back to IDLE."""
+        try:
+            handler = getattr(self, "on_" + kind, None)
+            if handler is None and kind.endswith("_error"):
+                handler = self.on_error
+            if handler is None:
+                raise ValueError(f"Evenement inconnu : {kind}")
+            handler(payload)
+        except Exception as e:
+            print(f"Erreur dans le traitement de '{kind}' :")
+            traceback.print_exc()
+            try:
+                self.on_error(e)
+            except Exception:
+                traceback.print_exc()
+
+    def on_model(self, model_state):
+        self.update_side_screens()
+
+    # --- Trace des latences ---
+    def finish_trace(self, outcome):
+        """Closes the current turn's trace and writes it out."""
+        trace, self.trace = self.trace, None
+        if trace is None:
+            return
+        trace.set(outcome=outcome, audio_overflows=audio_device.overflows - self.overflows_start)
+        record = trace_sink.write(trace)
+        print("Latences : " + ", ".join(f"{k} {v:.2f}s" for k, v in record["stages"].items()))
+
+    # --- Boutons ---
+    def on_button(self, ev):
+        if ev.pin == RECORD_PIN:
+            if ev.pressed and self.state == "IDLE":
+                self.start_recording(ev.time)
+            elif not ev.pressed and self.state == "RECORDING":
+                self.trace.mark("k2_release", ev.time)
+                self.record_stop.set()
+            elif ev.pressed and self.state == "VALIDATE":
+                # Annulation
+                self.finish_trace("rejected")
+                self.set_state("IDLE", user_text="")
+            elif ev.pressed and self.state == "THINKING":
+                # Barge-in : on coupe la generation et on reecoute aussitot
+                self.cancel_generation()
+                self.finish_trace("cancelled")
+                self.start_recording(ev.time)
+        elif ev.pin == VALIDATE_PIN and ev.pressed and self.state == "VALIDATE":
+            self.trace.mark("k1_press", ev.time)
+            self.start_thinking()
+        elif ev.pin == VALIDATE_PIN and ev.pressed and self.state == "IDLE":
+            # K1 au repos : nouvelle conversation
+            self.conversation.reset()
+            update_bot_text("(Nouvelle conversation)")
+
+    # --- Enregistrement et transcription ---
+    def start_recording(self, press_time=None):
+        # Nouveau tour : horodatage a partir du front d'appui sur K2
+        self.trace = TurnTrace()
+        self.trace.mark("k2_press", press_time)
+        self.overflows_start = audio_device.overflows
+
+        # On nettoie l'ecran central et on change l'etat
+        update_bot_text("")
+        self.set_state("RECORDING", user_text="")
+
+        # Rechauffage anticipe : le chargement du LLM recouvre enregistrement et transcription
+        model_manager.warm()
+
+        # Transcription en direct si le backend sait streamer, sinon apres relachement
+        self.session = None
+        if transcriber.supports_streaming:
+            self.session = transcriber.start_stream(on_partial=lambda text: self.post("partial", text))
+
+        self.record_stop = threading.Event()
+        on_chunk = self.session.feed if self.session else None
+        self.run_blocking(record_audio_hold, self.record_stop, on_chunk, self.trace, done="audio")
+
+    def on_partial(self, text):
+        # Transcription partielle affichee pendant l'enregistrement
+        if self.state == "RECORDING":
+            ui.update(user_text=text)
+
+    def on_audio(self, audio_data):
+        if self.state != "RECORDING":
+            return  # Tour abandonne (erreur)
+        if audio_data is None:
+            # Micro indisponible
+            if self.session is not None:
+                self.session.cancel()
+            self.finish_trace("no_audio")
+            self.set_state("IDLE")
+            return
+        self.trace.mark("audio_ready")
+        self.trace.set(audio_seconds=round(len(audio_data.frame_data) /
+                                           (audio_data.sample_rate * audio_data.sample_width), 3))
+        self.set_state("PROCESSING")
+        self.run_blocking(transcribe_audio, audio_data, self.session, done="transcript")
+
+    def on_transcript(self, txt):
+        if self.state != "PROCESSING":
+            return  # Tour abandonne (erreur)
+        self.trace.mark("transcript")
+        self.trace.set(transcriber=transcriber.name)
+        if txt:
+            self.set_state("VALIDATE", user_text=txt)
+        else: # Pas de transcription
+            self.finish_trace("no_speech")
+            update_bot_text("(Je n'ai pas compris)") # Affiche l'erreur au centre
+            self.set_state("IDLE")
+
+    # --- LLM ---
+    def start_thinking(self):
+        self.prompt = ui.get().user_text
+        self.set_state("THINKING", user_text="") # Efface pour l'ecran central
+
+        # Historique borne par le budget de tokens
+        messages = self.conversation.messages(self.prompt)
+        self.trace.set(model_state=model_manager.state, history_turns=len(self.conversation.turns))
+
+        # Question deja posee : reponse servie depuis le cache, sans LLM.
+        # La recherche se fait sur la question seule, quel que soit l'historique : sur la
+        # borne, la meme question revient souvent juste apres un autre echange. En
+        # contrepartie, une question de suivi dont le sens depend des tours precedents
+        # ("et pourquoi ?") peut recevoir la reponse hors contexte deja enregistree.
+        # Seules les reponses obtenues sans historique sont enregistrees (cacheable) :
+        # une reponse qui s'appuie sur des tours precedents n'est jamais rejouee.
+        self.cacheable = len(messages) == 2
+        answer = response_cache.get(self.prompt)
+        print(response_cache.stats())
+        if answer is not None:
+            self.serve_cached(answer)
+            return
+
+        self.builder = StreamingStrip(disp.width, disp.height, font_text)
+        self.last_render = 0.0
+        self.llm_task = asyncio.ensure_future(self.generate(messages))
+
+    async def generate(self, messages):
+        """
+        Streams the Ollama answer into the strip builder, then posts
+        'llm_done' (or 'llm_done_error'). Cancelling the task closes the HTTP
+        stream, and Ollama stops generating as soon as the client disconnects.
+        """
+        last = None
+        try:
+            stream = await self.llm_client.chat(model=OLLAMA_MODEL, messages=messages, stream=True,
+                                                keep_alive=OLLAMA_KEEP_ALIVE)
+            async for chunk in stream:
+                self.on_llm_chunk(chunk['message']['content'])
+                last = chunk
+        except asyncio.CancelledError:
+            print("Generation interrompue")
+            raise
+        except Exception as e:
+            self.post("llm_done_error", e)
+        else:
+            # Le dernier chunk (done=True) porte les compteurs d'Ollama
+            self.post("llm_done", last)
+
+    def cancel_generation(self):
+        """Aborts the in-flight request, if any (its result events are then ignored)."""
+        if self.llm_task is not None and not self.llm_task.done():
+            self.llm_task.cancel()
+        self.llm_task = None
+
+    def on_llm_chunk(self, text):
+        if text:
+            self.trace.mark("first_token")
+        self.builder.append(text)
+        # Rendu limite a STREAM_RENDER_INTERVAL pour ne jamais prendre de retard
+        now = time.time()
+        if now - self.last_render >= STREAM_RENDER_INTERVAL:
+            show_strip(self.builder.render())
+            self.trace.mark("first_paint")
+            self.last_render = now
+
+    def on_llm_done(self, last):
+        if self.state != "THINKING":
+            return  # Reponse annulee par un barge-in
+        model_manager.mark_used()
+        self.trace.mark("llm_done")
+        if last is not None:
+            self.trace.set_ollama(last)
+        # Seuls les tours termines entrent dans l'historique
+        self.conversation.add_turn(self.prompt, self.builder.text,
+                                   last.get('prompt_eval_count') if last else None,
+                                   last.get('eval_count') if last else None)
+        # Mise en page finale (centree ou defilante)
+        strip = update_bot_text(self.builder.text)
+        if self.cacheable:
+            response_cache.put(self.prompt, self.builder.text)
+            remember_answer_strip(response_cache.key(self.prompt), strip)
+        self.finish_trace("ok")
+        self.set_state("IDLE")
+
+    def serve_cached(self, answer):
+        key = response_cache.key(self.prompt)
+        strip = answer_strips.get(key)
+        if strip is None:
+            strip = update_bot_text(answer)
+        else:
+            show_strip(strip)
+        remember_answer_strip(key, strip)
+        # Le tour entre dans l'historique, pour les questions de suivi (la recherche
+        # dans le cache ne depend pas de l'historique)
+        self.conversation.add_turn(self.prompt, answer)
+        self.trace.mark("first_paint")
+        self.trace.mark("llm_done")
+        self.finish_trace("cache")
+        self.set_state("IDLE")
+
+    def on_llm_done_error(self, e):
+        if self.state != "THINKING":
+            return
+        update_bot_text(f"Erreur Ollama: {e}")
+        self.finish_trace("llm_error")
+        self.set_state("IDLE")
+
+    def on_error(self, e):
+        print(f"Erreur : {e}")
+        # Abandon du tour en cours : enregistrement, transcription et generation
+        if self.record_stop is not None:
+            self.record_stop.set()
+        if self.session is not None:
+            self.session.cancel()
+        self.cancel_generation()
+        self.finish_trace("error")
+        self.set_state("IDLE")
 
 # --- MAIN LOOP ---
 def main():
-    global state, user_text, running
+    global running
+
+    init_displays()
+    init_services()
+
+    # On fait le premier rendu du message d'accueil
+    update_bot_text(WELCOME_TEXT)
 
     # Lancement du thread d'affichage
     t = threading.Thread(target=display_thread_func)
@@ -301,74 +790,28 @@ def main():
     t.start()
 
     # Etat initial des ecrans lateraux
-    update_side_screens("Maintenez K2 pour parler", "IDLE")
-    
+    prewarm_side_frames()
+
+    if SIMULATED:
+        print("Materiel simule : lecture du scenario de boutons")
+        GPIO.run_script(SIM_BUTTON_SCRIPT)
+
     try:
-        while True:
-            # Attente K2 (Enregistrement)
-            if GPIO.input(RECORD_PIN) == GPIO.LOW:
-                # On nettoie l'ecran central et on change l'etat
-                update_bot_text("") 
-                with lock: state = "RECORDING"
-                update_side_screens("Enregistrement...", "RECORDING")
-                
-                if record_audio_hold():
-                    with lock: state = "PROCESSING"
-                    update_side_screens("Transcription...", "PROCESSING")
-                    txt = transcribe_audio()
-                    
-                    if txt:
-                        with lock:
-                            user_text = txt
-                            state = "VALIDATE"
-                        update_side_screens("Validez votre texte", "VALIDATE")
-                        
-                        validated = False
-                        # Boucle de validation
-                        while state == "VALIDATE":
-                            if GPIO.input(VALIDATE_PIN) == GPIO.LOW:
-                                validated = True
-                                break
-                            if GPIO.input(RECORD_PIN) == GPIO.LOW:
-                                while GPIO.input(RECORD_PIN) == GPIO.LOW: time.sleep(0.01)
-                                break
-                            time.sleep(0.05)
-                        
-                        if validated:
-                            prompt_for_api = ""
-                            with lock:
-                                state = "THINKING"
-                                prompt_for_api = user_text
-                                user_text = "" # Efface pour l'ecran central
-                            update_side_screens("Iana réfléchit...", "THINKING")
-                            
-                            try:
-                                messages = [
-                                    {'role': 'system', 'content': 'Tu es Iana, un assistant concis et efficace. Réponds en français.'},
-                                    {'role': 'user', 'content': prompt_for_api}
-                                ]
-                                response = ollama.chat(model=OLLAMA_MODEL, messages=messages)
-                                update_bot_text(response['message']['content'])
-                            except Exception as e:
-                                update_bot_text(f"Erreur Ollama: {e}")
-                        else: # Annulation
-                             with lock: user_text = "" # Clear le texte de validation
-                    else: # Pas de transcription
-                        update_bot_text("(Je n'ai pas compris)") # Affiche l'erreur au centre
-                    
-                    # Retour a l'etat initial
-                    with lock: state = "IDLE"
-                    update_side_screens("Maintenez K2 pour parler", "IDLE")
-
-                # Anti-rebond
-                while GPIO.input(RECORD_PIN) == GPIO.LOW: time.sleep(0.1)
-            
-            time.sleep(0.1)
+        asyncio.run(Assistant().run())
 
     except KeyboardInterrupt:
         print("Arret...")
+
+    finally:
         running = False
         t.join(1.0)
+        display_service.stop()
+        audio_device.close()
+        buttons.close()
+        response_cache.close()
+        if SIMULATED:
+            # Compteurs SPI et derniere image de chaque ecran
+            spidev.report(SIM_PNG_DIR)
         GPIO.cleanup()
         disp.close()
         disp_side1.close()
@@ -0,0 +1,115 @@
+# Description:
+# Cache persistant des reponses du LLM (fichier SQLite local), pour la borne qui recoit
+# souvent les memes questions : une question deja posee est servie immediatement, sans
+# appel a Ollama.
+# La cle combine la question normalisee, le modele et le prompt systeme ; les entrees
+# expirent apres un TTL et les moins recemment servies sont evincees au-dela d'un
+# nombre maximal d'entrees.
+
+import hashlib
+import re
+import sqlite3
+import time
+import unicodedata
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def normalize_prompt(text):
+    """
+    Canonical form of a question: case, accents, punctuation and spacing
+    are ignored ('Quelle heure est-il ?' == 'quelle heure est il').
+    """
+    text = unicodedata.normalize('NFKD', text.casefold())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+def cache_key(prompt, model, system_prompt):
+    h = hashlib.sha256()
+    for part in (model, system_prompt, normalize_prompt(prompt)):
+        h.update(part.encode('utf-8'))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    SQLite-backed answer cache with TTL and LRU eviction.
+    All methods must be called from the same thread (the asyncio loop).
+    """
+    def __init__(self, path, model, system_prompt, ttl=7 * 24 * 3600.0, max_entries=500,
+                 enabled=True):
+        """
+        Args:
+            path (str): SQLite file (created if missing).
+            ttl (float): Seconds after which an answer is no longer served.
+            max_entries (int): Size cap; least recently used entries go first.
+            enabled (bool): False bypasses the cache (get() always misses, put() is a no-op).
+        """
+        self.model = model
+        self.system_prompt = system_prompt
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(path)
+        self.db.execute(_SCHEMA)
+        self.db.commit()
+
+    def key(self, prompt):
+        return cache_key(prompt, self.model, self.system_prompt)
+
+    def get(self, prompt):
+        """Returns the cached answer for 'prompt', or None."""
+        if not self.enabled:
+            return None
+        key = self.key(prompt)
+        now = time.time()
+        row = self.db.execute("SELECT answer, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None and now - row[1] > self.ttl:
+            self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.db.commit()
+            row = None
+        if row is None:
+            self.misses += 1
+            return None
+        self.db.execute("UPDATE responses SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self.db.commit()
+        self.hits += 1
+        return row[0]
+
+    def put(self, prompt, answer):
+        if not self.enabled or not answer:
+            return
+        now = time.time()
+        self.db.execute("INSERT OR REPLACE INTO responses (key, prompt, answer, created, last_used, hits) "
+                        "VALUES (?, ?, ?, ?, ?, 0)", (self.key(prompt), prompt, answer, now, now))
+        self._evict(now)
+        self.db.commit()
+
+    def _evict(self, now):
+        self.db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        self.db.execute("DELETE FROM responses WHERE key IN (SELECT key FROM responses "
+                        "ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def stats(self):
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        return f"cache : {self.hits} hits / {self.misses} misses ({rate:.0%}), {len(self)} entrees"
+
+    def close(self):
+        self.db.close()
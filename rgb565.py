@@ -0,0 +1,189 @@
+# Description:
+# Conversion d'images PIL en tampons RGB565 big-endian pour les ecrans ST7789/ST7735S.
+# Le chemin rapide utilise NumPy (une seule passe vectorisee, aucun objet Python par
+# pixel). Le chemin de repli en pur Python reste disponible si NumPy est absent.
+# Fournit aussi la comparaison de trames (dirty rectangles) pour le rafraichissement partiel.
+#
+# Lancer `python rgb565.py` pour comparer les deux chemins (micro-benchmark).
+
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Taille max d'un transfert spidev (parametre noyau), 4096 par defaut
+SPIDEV_BUFSIZ_PATH = "/sys/module/spidev/parameters/bufsiz"
+DEFAULT_SPIDEV_BUFSIZ = 4096
+
+HAS_NUMPY = np is not None
+
+
+def spidev_bufsiz():
+    """Returns the kernel's spidev transfer size limit (bufsiz)."""
+    try:
+        with open(SPIDEV_BUFSIZ_PATH) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return DEFAULT_SPIDEV_BUFSIZ
+
+
+def _to_rgb(image):
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def rgb565_numpy(image):
+    """
+    Vectorized conversion of a PIL image to RGB565 big-endian bytes.
+    """
+    arr = np.asarray(_to_rgb(image), dtype=np.uint16)
+    val = ((arr[..., 0] & 0xF8) << 8) | ((arr[..., 1] & 0xFC) << 3) | (arr[..., 2] >> 3)
+    return val.astype('>u2').tobytes()
+
+
+def rgb565_python(image):
+    """
+    Pure-Python fallback. Works on the raw RGB bytes instead of getdata() tuples.
+    """
+    raw = _to_rgb(image).tobytes()
+    out = bytearray(len(raw) // 3 * 2)
+    j = 0
+    for i in range(0, len(raw), 3):
+        r, g, b = raw[i], raw[i + 1], raw[i + 2]
+        out[j] = (r & 0xF8) | (g >> 5)
+        out[j + 1] = ((g & 0x1C) << 3) | (b >> 3)
+        j += 2
+    return bytes(out)
+
+
+def image_to_rgb565(image, fast=True):
+    """
+    Converts a PIL image to a contiguous RGB565 big-endian buffer.
+    Args:
+        image (PIL.Image): Source image (converted to RGB if needed).
+        fast (bool): Use the NumPy path when available (default).
+    """
+    if fast and HAS_NUMPY:
+        return rgb565_numpy(image)
+    return rgb565_python(image)
+
+
+def write_buffer(spi, buf, chunk_size=None):
+    """
+    Sends a bytes-like buffer over spidev without building Python int lists.
+    Each transfer is limited to the kernel's bufsiz.
+    """
+    if chunk_size is None:
+        chunk_size = spidev_bufsiz()
+    mv = memoryview(buf)
+    if hasattr(spi, 'writebytes2'):
+        for i in range(0, len(mv), chunk_size):
+            spi.writebytes2(mv[i:i + chunk_size])
+    else:
+        # Anciennes versions de spidev : writebytes n'accepte que des listes
+        for i in range(0, len(mv), chunk_size):
+            spi.writebytes(list(mv[i:i + chunk_size]))
+
+
+def _changed_rows(old, new, width, height):
+    stride = width * 2
+    old_mv, new_mv = memoryview(old), memoryview(new)
+    return [y for y in range(height)
+            if old_mv[y * stride:(y + 1) * stride] != new_mv[y * stride:(y + 1) * stride]]
+
+
+def _merge_bands(rows, gap):
+    """Groups sorted row indices into [y0, y1] bands, bridging gaps <= gap."""
+    bands = []
+    for y in rows:
+        if bands and y - bands[-1][1] <= gap + 1:
+            bands[-1][1] = y
+        else:
+            bands.append([y, y])
+    return bands
+
+
+def dirty_rects(old, new, width, height, max_rects=4, gap=8):
+    """
+    Compares two RGB565 frames and returns the changed regions.
+    Returns a list of inclusive (x0, y0, x1, y1) rectangles, at most max_rects.
+    Nearby changed rows (closer than gap) are merged into one rectangle.
+    """
+    if HAS_NUMPY:
+        a = np.frombuffer(old, dtype='>u2').reshape(height, width)
+        b = np.frombuffer(new, dtype='>u2').reshape(height, width)
+        diff = a != b
+        rows = np.flatnonzero(diff.any(axis=1)).tolist()
+    else:
+        diff = None
+        rows = _changed_rows(old, new, width, height)
+
+    if not rows:
+        return []
+
+    bands = _merge_bands(rows, gap)
+
+    # Trop de bandes : on fusionne les plus proches jusqu'a max_rects
+    while len(bands) > max_rects:
+        i = min(range(len(bands) - 1), key=lambda k: bands[k + 1][0] - bands[k][1])
+        bands[i] = [bands[i][0], bands[i + 1][1]]
+        del bands[i + 1]
+
+    rects = []
+    for y0, y1 in bands:
+        if diff is not None:
+            cols = np.flatnonzero(diff[y0:y1 + 1].any(axis=0))
+            x0, x1 = int(cols[0]), int(cols[-1])
+        else:
+            x0, x1 = 0, width - 1
+        rects.append((x0, y0, x1, y1))
+    return rects
+
+
+def extract_rect(buf, width, rect):
+    """
+    Returns the RGB565 bytes of an inclusive (x0, y0, x1, y1) rectangle.
+    Full-width rectangles are returned as a zero-copy memoryview.
+    """
+    x0, y0, x1, y1 = rect
+    stride = width * 2
+    mv = memoryview(buf)
+    if x0 == 0 and x1 == width - 1:
+        return mv[y0 * stride:(y1 + 1) * stride]
+    return b"".join(mv[y * stride + x0 * 2:y * stride + (x1 + 1) * 2] for y in range(y0, y1 + 1))
+
+
+def benchmark(width=240, height=240, runs=20):
+    """Compares the NumPy and pure-Python conversion paths."""
+    from PIL import Image
+    import os
+
+    image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    results = {}
+
+    paths = [("python", rgb565_python)]
+    if HAS_NUMPY:
+        paths.insert(0, ("numpy", rgb565_numpy))
+
+    for name, func in paths:
+        func(image)  # Echauffement
+        start = time.perf_counter()
+        for _ in range(runs):
+            func(image)
+        results[name] = (time.perf_counter() - start) / runs
+
+    if HAS_NUMPY:
+        assert rgb565_numpy(image) == rgb565_python(image)
+    return results
+
+
+if __name__ == "__main__":
+    print(f"=== BENCHMARK RGB565 (240x240, spidev bufsiz={spidev_bufsiz()}) ===")
+    res = benchmark()
+    for name, t in res.items():
+        print(f"{name:>8}: {t * 1000:8.2f} ms/frame ({1.0 / t:7.1f} FPS max)")
+    if "numpy" in res:
+        print(f"Gain : x{res['python'] / res['numpy']:.1f}")
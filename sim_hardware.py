@@ -0,0 +1,412 @@
+# Description:
+# Materiel simule pour faire tourner l'application (et les scripts de test) sans Pi,
+# a vitesse reelle, afin de mesurer frame rate et latences sur une machine Linux.
+# - spidev  : SpiDev qui decode les commandes ST7789/ST7735S (CASET/RASET/RAMWR)
+#             et reconstruit l'image RGB565 en memoire (export PNG), avec compteurs
+#             d'octets et de transferts et, en option, la duree de transfert du bus.
+# - GPIO    : niveaux des broches en memoire, detection de fronts et appuis scriptables.
+# - pyaudio : micro qui rejoue test_mic.wav en boucle, au rythme reel, en mode callback.
+# Selection via hardware.py (HARDWARE = "sim" ou IANA_HARDWARE=sim).
+
+import os
+import threading
+import time
+import wave
+
+from rgb565 import HAS_NUMPY
+from waveshare_config import CONFIGS
+
+if HAS_NUMPY:
+    import numpy as np
+
+# Simule la duree des transferts SPI (octets * 8 / max_speed_hz)
+SPI_TIMING = True
+# Fichier rejoue par le micro simule
+WAV_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_mic.wav")
+
+
+# --- GPIO ---
+class _FakeGPIO:
+    """Subset of the RPi.GPIO API used by this project."""
+    BCM = 11
+    BOARD = 10
+    IN = 1
+    OUT = 0
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 22
+    PUD_DOWN = 21
+    PUD_OFF = 20
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.levels = {}
+        self._callbacks = {}
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        with self._lock:
+            if direction == self.IN:
+                self.levels.setdefault(pin, self.LOW if pull_up_down == self.PUD_DOWN else self.HIGH)
+            else:
+                self.levels[pin] = self.LOW if initial is None else initial
+
+    def output(self, pin, value):
+        self.levels[pin] = self.HIGH if value else self.LOW
+
+    def input(self, pin):
+        return self.levels.get(pin, self.HIGH)
+
+    def add_event_detect(self, pin, edge, callback=None, bouncetime=None):
+        with self._lock:
+            self._callbacks[pin] = (edge, callback)
+
+    def remove_event_detect(self, pin):
+        with self._lock:
+            self._callbacks.pop(pin, None)
+
+    def cleanup(self, *args):
+        with self._lock:
+            self._callbacks.clear()
+
+    # --- Pilotage des boutons (actifs a l'etat bas) ---
+    def set_input(self, pin, level):
+        """Drives an input pin and fires its edge callback, as the real library would."""
+        with self._lock:
+            old = self.levels.get(pin, self.HIGH)
+            self.levels[pin] = level
+            edge, callback = self._callbacks.get(pin, (None, None))
+        if callback is None or old == level:
+            return
+        rising = level == self.HIGH
+        if edge == self.BOTH or edge == (self.RISING if rising else self.FALLING):
+            callback(pin)
+
+    def press(self, pin, hold=0.1):
+        """Presses and releases a button (blocking)."""
+        self.set_input(pin, self.LOW)
+        time.sleep(hold)
+        self.set_input(pin, self.HIGH)
+
+    def run_script(self, steps):
+        """
+        Plays button events in a background thread.
+        Args:
+            steps (list): (delay_seconds, pin, pressed) tuples; each delay is
+                relative to the previous step.
+        """
+        def play():
+            for delay, pin, pressed in steps:
+                time.sleep(delay)
+                self.set_input(pin, self.LOW if pressed else self.HIGH)
+        t = threading.Thread(target=play, daemon=True)
+        t.start()
+        return t
+
+
+GPIO = _FakeGPIO()
+
+
+# --- SPI ---
+# Zone adressable simulee (couvre la GRAM 240x320 de l'ST7789 dans toutes les orientations)
+CANVAS_SIZE = 320
+
+# Broche DC de chaque ecran, par (bus, device) SPI
+_DC_PINS = {(c['spi_bus'], c['spi_device']): c['dc'] for c in CONFIGS}
+
+
+def rgb565_to_image(buf, width, height):
+    """Decodes a big-endian RGB565 buffer to a PIL Image."""
+    from PIL import Image
+    if HAS_NUMPY:
+        a = np.frombuffer(buf, dtype='>u2').reshape(height, width).astype(np.uint32)
+        rgb = np.empty((height, width, 3), dtype=np.uint8)
+        rgb[..., 0] = ((a >> 11) & 0x1F) * 255 // 31
+        rgb[..., 1] = ((a >> 5) & 0x3F) * 255 // 63
+        rgb[..., 2] = (a & 0x1F) * 255 // 31
+        return Image.fromarray(rgb, 'RGB')
+    img = Image.new('RGB', (width, height))
+    px = []
+    for i in range(0, width * height * 2, 2):
+        v = (buf[i] << 8) | buf[i + 1]
+        px.append((((v >> 11) & 0x1F) * 255 // 31, ((v >> 5) & 0x3F) * 255 // 63, (v & 0x1F) * 255 // 31))
+    img.putdata(px)
+    return img
+
+
+class SpiDev:
+    """
+    Fake spidev.SpiDev for the ST7789/ST7735S command set.
+    Commands and data are told apart from the DC pin level (as on the
+    panel). Pixel data written after RAMWR lands in a canvas addressed like
+    the controller window, so frame() shows what the panel would display.
+    """
+    # Tous les peripheriques ouverts, pour les rapports
+    devices = []
+
+    def __init__(self):
+        self.max_speed_hz = 500000
+        self.mode = 0
+        self.bus = self.device = None
+        self.dc_pin = None
+        self.timing = SPI_TIMING
+        self.canvas = bytearray(CANVAS_SIZE * CANVAS_SIZE * 2)
+
+        # Compteurs
+        self.bytes = 0
+        self.transfers = 0
+        self.commands = 0
+        self.frames = 0  # Nombre de RAMWR
+        self.busy_time = 0.0  # Duree de bus simulee, en secondes
+
+        self._cmd = None
+        self._args = []
+        self._window = (0, 0, CANVAS_SIZE - 1, CANVAS_SIZE - 1)
+        self._x = self._y = 0
+        self._odd = b""
+        self._touched = None  # Rectangle englobant des ecritures (x0, y0, x1, y1)
+
+    def open(self, bus, device):
+        self.bus, self.device = bus, device
+        self.dc_pin = _DC_PINS.get((bus, device))
+        SpiDev.devices.append(self)
+
+    def close(self):
+        if self in SpiDev.devices:
+            SpiDev.devices.remove(self)
+
+    def _is_data(self):
+        return self.dc_pin is not None and GPIO.input(self.dc_pin) == GPIO.HIGH
+
+    def writebytes(self, data):
+        self._transfer(bytes(data))
+
+    def writebytes2(self, data):
+        self._transfer(memoryview(data).cast('B'))
+
+    def xfer2(self, data):
+        self._transfer(bytes(data))
+        return [0] * len(data)
+
+    def _transfer(self, data):
+        n = len(data)
+        self.bytes += n
+        self.transfers += 1
+        if self.timing and n:
+            duration = n * 8 / self.max_speed_hz
+            self.busy_time += duration
+            time.sleep(duration)
+
+        if not self._is_data():
+            for cmd in bytes(data):
+                self._command(cmd)
+        elif self._cmd == 0x2C:
+            self._write_pixels(data)
+        else:
+            self._args.extend(bytes(data))
+            self._apply_args()
+
+    def _command(self, cmd):
+        self.commands += 1
+        self._cmd = cmd
+        self._args = []
+        if cmd == 0x2C:  # RAMWR
+            self.frames += 1
+            self._x, self._y = self._window[0], self._window[1]
+            self._odd = b""
+
+    def _apply_args(self):
+        a = self._args
+        if self._cmd in (0x2A, 0x2B) and len(a) >= 4:
+            start, end = (a[0] << 8) | a[1], (a[2] << 8) | a[3]
+            x0, y0, x1, y1 = self._window
+            if self._cmd == 0x2A:
+                self._window = (start, y0, end, y1)
+            else:
+                self._window = (x0, start, x1, end)
+
+    def _write_pixels(self, data):
+        if self._odd:
+            data = self._odd + bytes(data)
+            self._odd = b""
+        x0, y0, x1, y1 = self._window
+        x1, y1 = min(x1, CANVAS_SIZE - 1), min(y1, CANVAS_SIZE - 1)
+        n = len(data) - len(data) % 2
+        if n < len(data):
+            self._odd = bytes(data[n:])
+        i = 0
+        while i < n:
+            take = min((x1 - self._x + 1) * 2, n - i)
+            off = (self._y * CANVAS_SIZE + self._x) * 2
+            self.canvas[off:off + take] = data[i:i + take]
+            self._x += take // 2
+            i += take
+            if self._x > x1:
+                self._x = x0
+                self._y = self._y + 1 if self._y < y1 else y0
+        t = self._touched
+        self._touched = (x0, y0, x1, y1) if t is None else \
+            (min(t[0], x0), min(t[1], y0), max(t[2], x1), max(t[3], y1))
+
+    def frame(self, rect=None):
+        """
+        Returns the displayed content of 'rect' (inclusive x0, y0, x1, y1,
+        controller coordinates; default: everything written so far) as a
+        PIL Image.
+        """
+        if rect is None:
+            rect = self._touched or (0, 0, 0, 0)
+        x0, y0, x1, y1 = rect
+        w, h = x1 - x0 + 1, y1 - y0 + 1
+        stride = CANVAS_SIZE * 2
+        out = bytearray()
+        for y in range(y0, y1 + 1):
+            out += self.canvas[y * stride + x0 * 2:y * stride + (x0 + w) * 2]
+        return rgb565_to_image(bytes(out), w, h)
+
+    def save_png(self, path, rect=None):
+        self.frame(rect).save(path)
+
+    def stats(self):
+        return (f"SPI{self.bus}.{self.device} : {self.bytes} octets, {self.transfers} transferts, "
+                f"{self.frames} RAMWR, bus {self.busy_time:.2f}s")
+
+
+def report(png_dir=None):
+    """Prints SPI counters of all open devices; optionally saves their frames as PNG."""
+    for dev in list(SpiDev.devices):
+        print(dev.stats())
+        if png_dir is not None:
+            os.makedirs(png_dir, exist_ok=True)
+            dev.save_png(os.path.join(png_dir, f"spi{dev.bus}_{dev.device}.png"))
+
+
+class _SpidevModule:
+    """Stands in for the spidev module."""
+    SpiDev = SpiDev
+    report = staticmethod(report)
+
+
+spidev = _SpidevModule()
+
+
+# --- Audio ---
+class _FakeStream:
+    """Callback or blocking input stream replaying a WAV file in a loop, at real pace."""
+    def __init__(self, wav_path, frames_per_buffer, stream_callback=None):
+        self._wav = wave.open(wav_path, 'rb')
+        self.rate = self._wav.getframerate()
+        self.channels = self._wav.getnchannels()
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = stream_callback
+        self._active = False
+        self._thread = None
+        self._next = 0.0
+
+    def _read_frames(self, n):
+        data = self._wav.readframes(n)
+        while len(data) < n * 2 * self.channels:
+            self._wav.rewind()
+            data += self._wav.readframes(n - len(data) // (2 * self.channels))
+        if self.channels > 1 and HAS_NUMPY:
+            data = np.frombuffer(data, dtype=np.int16)[::self.channels].tobytes()
+        return data
+
+    def _pace(self, n):
+        # Rythme reel : un chunk toutes les n / rate secondes
+        self._next = max(self._next, time.monotonic()) + n / self.rate
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def _run(self):
+        while self._active:
+            self._pace(self.frames_per_buffer)
+            if not self._active:
+                break
+            data = self._read_frames(self.frames_per_buffer)
+            self.callback(data, self.frames_per_buffer, {}, 0)
+
+    def start_stream(self):
+        if self._active:
+            return
+        self._active = True
+        self._next = time.monotonic()
+        if self.callback is not None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop_stream(self):
+        self._active = False
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(1.0)
+        self._thread = None
+
+    def is_active(self):
+        return self._active
+
+    def read(self, num_frames, exception_on_overflow=True):
+        self._pace(num_frames)
+        return self._read_frames(num_frames)
+
+    def close(self):
+        self.stop_stream()
+        self._wav.close()
+
+
+class _FakePyAudio:
+    """PyAudio instance with one input device: the WAV file."""
+    def __init__(self, wav_path):
+        self.wav_path = wav_path
+        with wave.open(wav_path, 'rb') as w:
+            self.rate = w.getframerate()
+
+    def get_default_input_device_info(self):
+        return {'index': 0, 'name': os.path.basename(self.wav_path),
+                'maxInputChannels': 1, 'defaultSampleRate': float(self.rate)}
+
+    def get_device_count(self):
+        return 1
+
+    def get_device_info_by_index(self, index):
+        return self.get_default_input_device_info()
+
+    def is_format_supported(self, rate, input_device=None, input_channels=None, input_format=None, **kwargs):
+        if rate != self.rate:
+            raise ValueError("Invalid sample rate")
+        return True
+
+    def get_sample_size(self, fmt):
+        return 2
+
+    def open(self, rate=None, channels=1, format=None, input=False, input_device_index=None,
+             frames_per_buffer=1024, stream_callback=None, start=True, **kwargs):
+        stream = _FakeStream(self.wav_path, frames_per_buffer, stream_callback)
+        if start:
+            stream.start_stream()
+        return stream
+
+    def terminate(self):
+        pass
+
+
+class _PyAudioModule:
+    """Stands in for the pyaudio module (int16 only)."""
+    paInt16 = 8
+    paContinue = 0
+    paComplete = 1
+    paInputOverflow = 2
+
+    def PyAudio(self):
+        return _FakePyAudio(WAV_PATH)
+
+
+pyaudio = _PyAudioModule()
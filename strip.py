@@ -0,0 +1,294 @@
+# Description:
+# Bande de texte pre-encodee en RGB565 pour l'ecran central.
+# L'image est convertie une seule fois a l'arrivee de la reponse ; chaque trame de
+# scroll n'est ensuite qu'une tranche memoryview des lignes visibles, envoyee telle
+# quelle a l'ecran (aucune allocation PIL ni conversion par trame).
+# StreamingStrip construit la bande au fil des tokens du LLM, en ne re-rendant que
+# la derniere ligne, et ne garde encodees que les lignes proches de la fin (fenetre
+# glissante de 2 ecrans) : les lignes plus anciennes sont re-rendues a la demande.
+# TiledStrip ne garde que les lignes wrappees et rend des tuiles de hauteur fixe a la
+# demande autour du viewport : la memoire reste bornee quelle que soit la longueur.
+
+from collections import OrderedDict
+
+from PIL import Image, ImageDraw
+
+from rgb565 import image_to_rgb565
+from text_layout import wrap_text_pixel
+
+
+class EncodedStrip:
+    """
+    A tall image encoded once to RGB565, sliced into viewports by rows.
+    """
+    # Bande en cours de generation : l'ecran suit la fin du texte
+    follow = False
+
+    def __init__(self, image):
+        self.width, self.height = image.size
+        self.stride = self.width * 2
+        self.data = image_to_rgb565(image)
+        self._view = memoryview(self.data)
+
+    @classmethod
+    def from_buffer(cls, data, width, height):
+        """Wraps an already encoded RGB565 buffer (no copy)."""
+        strip = cls.__new__(cls)
+        strip.width, strip.height = width, height
+        strip.stride = width * 2
+        strip.data = data
+        strip._view = memoryview(data)
+        return strip
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def rows(self, y0, y1):
+        """Zero-copy view of rows [y0, y1)."""
+        return self._view[y0 * self.stride:y1 * self.stride]
+
+    def viewport(self, sy, height, wrap=False):
+        """
+        Returns the rows [sy, sy + height) as a list of memoryview segments.
+        With wrap=True, a viewport running past the end continues from the
+        top of the strip (two segments), as in test_scrolling.py.
+        """
+        end = sy + height
+        if end <= self.height:
+            return [self.rows(sy, end)]
+        if wrap:
+            return [self.rows(sy, self.height), self.rows(0, end - self.height)]
+        return [self.rows(max(0, self.height - height), self.height)]
+
+
+class TiledStrip:
+    """
+    A text strip rendered lazily in fixed-height RGB565 tiles.
+    Same interface as EncodedStrip (rows, viewport), but only the tiles
+    around the requested rows are rendered, and a small LRU keeps them.
+    """
+    follow = False
+
+    def __init__(self, lines, width, height, font, line_h, top, tile_h=64, max_tiles=8,
+                 fill=(255, 255, 255)):
+        """
+        Args:
+            lines (list): Wrapped lines of text.
+            width, height (int): Size of the whole strip in pixels.
+            line_h (int): Line pitch. Line i is drawn at y = top + i * line_h.
+            tile_h (int): Rows per tile. max_tiles bounds the tile cache.
+        """
+        self.lines = lines
+        self.width, self.height = width, height
+        self.stride = width * 2
+        self.font = font
+        self.line_h = line_h
+        self.top = top
+        self.tile_h = tile_h
+        self.max_tiles = max_tiles
+        self.fill = fill
+        self._tiles = OrderedDict()
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def _render_tile(self, k):
+        y0 = k * self.tile_h
+        h = min(self.tile_h, self.height - y0)
+        img = Image.new('RGB', (self.width, h), (0, 0, 0))
+        draw = ImageDraw.Draw(img)
+
+        # Lignes qui touchent la tuile (une de marge de chaque cote pour les debords)
+        first = max(0, int((y0 - self.top) // self.line_h) - 1)
+        last = min(len(self.lines), int((y0 + h - self.top) // self.line_h) + 2)
+        for i in range(first, last):
+            draw.text((5, self.top + i * self.line_h - y0), self.lines[i], font=self.font, fill=self.fill)
+
+        return image_to_rgb565(img)
+
+    def _tile(self, k):
+        data = self._tiles.get(k)
+        if data is None:
+            data = self._render_tile(k)
+            self._tiles[k] = data
+            if len(self._tiles) > self.max_tiles:
+                self._tiles.popitem(last=False)
+        else:
+            self._tiles.move_to_end(k)
+        return data
+
+    def segments(self, y0, y1):
+        """Rows [y0, y1) as a list of zero-copy tile slices."""
+        segs = []
+        y = y0
+        while y < y1:
+            k = y // self.tile_h
+            t0 = k * self.tile_h
+            end = min(y1, t0 + self.tile_h)
+            segs.append(memoryview(self._tile(k))[(y - t0) * self.stride:(end - t0) * self.stride])
+            y = end
+        return segs
+
+    def rows(self, y0, y1):
+        """Rows [y0, y1) as one contiguous buffer (copied only across tiles)."""
+        segs = self.segments(y0, y1)
+        return segs[0] if len(segs) == 1 else b"".join(segs)
+
+    def viewport(self, sy, height, wrap=False):
+        """Same as EncodedStrip.viewport, returned as tile slices."""
+        end = sy + height
+        if end <= self.height:
+            return self.segments(sy, end)
+        if wrap:
+            return self.segments(sy, self.height) + self.segments(0, end - self.height)
+        return self.segments(max(0, self.height - height), self.height)
+
+
+class StreamingView:
+    """
+    Strip returned by StreamingStrip.render(). The last screen of rows is a
+    private copy of the encoded window, so later renders never change a frame
+    already queued to the display; earlier rows are rendered on demand by a
+    TiledStrip over the same lines.
+    """
+    follow = True
+
+    def __init__(self, window, top, width, height, content_height, lines, font, line_h, margin):
+        self.width, self.height = width, height
+        self.stride = width * 2
+        self.content_height = content_height
+        self._window = memoryview(window)
+        self._top = top
+        self._bottom = top + len(self._window) // self.stride
+        self._lines = lines
+        self._font = font
+        self._line_h = line_h
+        self._margin = margin
+        self._tiled = None
+
+    @property
+    def size(self):
+        return self.width, self.height
+
+    def rows(self, y0, y1):
+        """Rows [y0, y1): a zero-copy slice inside the window, rendered otherwise."""
+        if self._top <= y0 and y1 <= self._bottom:
+            return self._window[(y0 - self._top) * self.stride:(y1 - self._top) * self.stride]
+        if self._tiled is None:
+            self._tiled = TiledStrip(self._lines, self.width, self.height, self._font,
+                                     self._line_h, self._margin)
+        return self._tiled.rows(y0, y1)
+
+    def viewport(self, sy, height, wrap=False):
+        """Same as EncodedStrip.viewport."""
+        end = sy + height
+        if end <= self.height:
+            return [self.rows(sy, end)]
+        if wrap:
+            return [self.rows(sy, self.height), self.rows(0, end - self.height)]
+        return [self.rows(max(0, self.height - height), self.height)]
+
+
+class StreamingStrip:
+    """
+    Builds a top-aligned text strip incrementally from streamed text chunks.
+    Only lines whose text changed since the last render() are redrawn and
+    re-encoded; finished lines are never touched again.
+    Only 'window_rows' rows near the end are kept encoded, so memory stays
+    bounded whatever the length of the answer.
+    """
+    def __init__(self, width, height, font, margin=5, window_rows=None):
+        """
+        Args:
+            width, height (int): Panel size; the strip is at least 'height' rows.
+            margin (int): Rows above the first line.
+            window_rows (int): Encoded rows kept near the end (default: 2 * height).
+        """
+        self.width = width
+        self.height = height  # Hauteur minimale (celle de l'ecran)
+        self.font = font
+        self.margin = margin
+        self.line_h = font.getbbox("Mg")[3] - font.getbbox("Mg")[1] + 4
+        self.stride = width * 2
+
+        self.text = ""
+        self.lines = []   # Lignes terminees (ne changeront plus)
+        self.tail = ""    # Texte de la derniere ligne, encore susceptible de changer
+        self._drawn = []  # Texte actuellement rendu pour chaque ligne
+
+        # Fenetre encodee : lignes [_top, _top + window_rows) de la bande, noire au depart
+        self.window_rows = window_rows or 2 * height
+        self._top = 0
+        self._buf = bytearray(self.window_rows * self.stride)
+        self._scratch = Image.new('RGB', (width, self.line_h), (0, 0, 0))
+        self._draw = ImageDraw.Draw(self._scratch)
+
+    def append(self, chunk):
+        """Adds a text chunk. Only the last line is re-wrapped."""
+        if not chunk:
+            return
+        self.text += chunk
+        self.tail += chunk
+        # Le wrap glouton est stable : seules les lignes apres la derniere
+        # coupure peuvent encore changer
+        wrapped = wrap_text_pixel(self.tail, self.font, self.width - 10)
+        if not wrapped:
+            return
+        self.lines.extend(wrapped[:-1])
+        self.tail = wrapped[-1] + (" " if self.tail[-1].isspace() else "")
+
+    def _all_lines(self):
+        tail = self.tail.strip()
+        return self.lines + [tail] if tail else list(self.lines)
+
+    def _slide(self, rows):
+        """Moves the window down so that it ends at least 'rows' rows into the strip."""
+        if rows <= self._top + self.window_rows:
+            return
+        # Le viewport (les 'height' dernieres lignes) reste au debut de la fenetre,
+        # le reste sert a la croissance jusqu'au prochain glissement
+        top = max(self._top, rows - self.height)
+        keep = max(0, self._top + self.window_rows - top)
+        if keep:
+            start = (top - self._top) * self.stride
+            self._buf[:keep * self.stride] = self._buf[start:start + keep * self.stride]
+        self._buf[keep * self.stride:] = bytes(len(self._buf) - keep * self.stride)
+        self._top = top
+
+    def render(self):
+        """
+        Draws the changed lines and returns a StreamingView of the current
+        content (at least 'height' rows tall), independent of later renders.
+        """
+        lines = self._all_lines()
+        content_h = self.margin + len(lines) * self.line_h
+        rows = max(self.height, content_h)
+        self._slide(rows)
+        bottom = self._top + self.window_rows
+
+        # Seules les lignes qui touchent la fenetre sont (re)dessinees
+        first = max(0, (self._top - self.margin) // self.line_h)
+        for i in range(first, len(lines)):
+            line = lines[i]
+            if i < len(self._drawn) and self._drawn[i] == line:
+                continue
+            self._draw.rectangle((0, 0, self.width, self.line_h), fill=(0, 0, 0))
+            self._draw.text((5, 0), line, font=self.font, fill=(255, 255, 255))
+            data = image_to_rgb565(self._scratch)
+
+            # Partie de la ligne dans la fenetre (le haut peut deja en etre sorti)
+            y = self.margin + i * self.line_h
+            y0, y1 = max(y, self._top), min(y + self.line_h, bottom)
+            self._buf[(y0 - self._top) * self.stride:(y1 - self._top) * self.stride] = \
+                data[(y0 - y) * self.stride:(y1 - y) * self.stride]
+            self._drawn.extend([None] * (i + 1 - len(self._drawn)))
+            self._drawn[i] = line
+
+        # Copie du dernier ecran : le thread d'ecriture SPI peut encore lire une vue
+        # soumise plus tot pendant que le prochain rendu modifie la fenetre en place
+        top = rows - self.height
+        window = bytes(memoryview(self._buf)[(top - self._top) * self.stride:(rows - self._top) * self.stride])
+        return StreamingView(window, top, self.width, rows, content_h,
+                             lines, self.font, self.line_h, self.margin)
@@ -1,7 +1,6 @@
 import time
 import sys
-import spidev
-import RPi.GPIO as GPIO
+from hardware import spidev, GPIO
 from PIL import Image, ImageDraw, ImageFont
 
 # Configuration Pi 5 pour l'écran 1.3" (SPI1)
@@ -1,7 +1,6 @@
 import time
 import sys
-import spidev
-import RPi.GPIO as GPIO
+from hardware import spidev, GPIO
 from PIL import Image, ImageDraw, ImageFont
 from waveshare_config import CONFIGS
 
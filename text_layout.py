@@ -0,0 +1,218 @@
+# Description:
+# Mise en page du texte au pixel pour les ecrans.
+# Chaque mot est mesure une seule fois par police (cache LRU borne, cle = police + taille),
+# puis les lignes sont construites en temps lineaire en additionnant les avances.
+# La somme des avances ignore le crenage aux frontieres mot/espace et l'arrondi de la
+# boite de la ligne entiere : pres de la limite, la decision est donc reprise avec
+# font.getbbox() de la ligne candidate, comme l'ancien wrap_text_pixel (textbbox).
+# Seule difference voulue : les mots plus larges que la ligne sont maintenant coupes.
+# Verification sur la vraie police : python text_layout.py
+
+from collections import OrderedDict
+import threading
+
+WORD_CACHE_SIZE = 4096
+HYPHEN = "-"
+# Ecart (px) entre estimation et mesure exacte en deca duquel on mesure la ligne entiere,
+# plus 1 px par frontiere de mot (crenage autour des espaces)
+EXACT_MARGIN = 2
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _font_key(font):
+    # Meme fichier + meme taille = memes mesures, meme si la police a ete rechargee
+    path = getattr(font, 'path', None)
+    if path is None:
+        return id(font)
+    return (path, font.size)
+
+
+def measure(font, word):
+    """
+    Returns (advance, left, right) for 'word', cached per font and size.
+    'left'/'right' are the horizontal bounds of its bounding box drawn at x=0.
+    """
+    key = (_font_key(font), word)
+    with _cache_lock:
+        m = _cache.get(key)
+        if m is not None:
+            _cache.move_to_end(key)
+            return m
+
+    bbox = font.getbbox(word)
+    m = (font.getlength(word), bbox[0], bbox[2])
+
+    with _cache_lock:
+        _cache[key] = m
+        if len(_cache) > WORD_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return m
+
+
+def line_width(line, font):
+    """
+    Pixel width of a line from cached words. Matches textbbox() right - left
+    to within a pixel or so (no kerning across spaces): fine for centering.
+    """
+    words = line.split()
+    if not words:
+        return 0
+    space = measure(font, " ")[0]
+    pen = 0
+    for word in words[:-1]:
+        pen += measure(font, word)[0] + space
+    return pen + measure(font, words[-1])[2] - measure(font, words[0])[1]
+
+
+def _split_word(word, font, width):
+    """Splits a word wider than 'width' into hyphenated pieces that fit."""
+    pieces = []
+    start = 0
+    while start < len(word):
+        end = start + 1
+        # On avance caractere par caractere tant que le morceau (avec tiret) tient
+        while end < len(word):
+            adv, left, right = measure(font, word[start:end + 1] + HYPHEN)
+            if right - left > width:
+                break
+            end += 1
+        if end < len(word):
+            pieces.append(word[start:end] + HYPHEN)
+        else:
+            pieces.append(word[start:end])
+        start = end
+    return pieces
+
+
+def _exact_width(font, line):
+    """Width of the whole line as textbbox() measures it (rounded once, with kerning)."""
+    bbox = font.getbbox(line)
+    return bbox[2] - bbox[0]
+
+
+def wrap_text_pixel(text, font, width):
+    """
+    Wraps text based on pixel width, not character count.
+    Returns a list of lines.
+    """
+    words = text.split()
+    if not words:
+        return []
+
+    space = measure(font, " ")[0]
+    lines = []
+    current = []
+    pen = 0    # Avance cumulee de la ligne courante (mots + espaces)
+    left = 0   # Debord gauche du premier mot de la ligne
+
+    for word in words:
+        adv, w_left, w_right = measure(font, word)
+
+        if w_right - w_left > width:
+            # Mot plus large que la ligne : on le coupe
+            if current:
+                lines.append(" ".join(current))
+            pieces = _split_word(word, font, width)
+            lines.extend(pieces[:-1])
+            word = pieces[-1]
+            adv, w_left, w_right = measure(font, word)
+            current, pen, left = [word], adv, w_left
+            continue
+
+        if not current:
+            current, pen, left = [word], adv, w_left
+            continue
+
+        estimate = pen + space + w_right - left
+        margin = EXACT_MARGIN + len(current)
+        if abs(estimate - width) <= margin:
+            # Trop pres de la limite pour l'estimation : mesure de la ligne candidate
+            too_long = _exact_width(font, " ".join(current) + " " + word) > width
+        else:
+            too_long = estimate > width
+
+        if too_long:
+            # The new word makes the line too long, so save the current line
+            lines.append(" ".join(current))
+            current, pen, left = [word], adv, w_left
+        else:
+            # The new word fits, so add it to the current line
+            current.append(word)
+            pen += space + adv
+
+    # Add the last remaining line
+    lines.append(" ".join(current))
+    return lines
+
+
+def _reference_wrap(text, font, width):
+    """The previous wrap_text_pixel: one textbbox of the whole candidate line per word."""
+    words = text.split()
+    if not words:
+        return []
+    lines = []
+    current = words[0]
+    for word in words[1:]:
+        test = f"{current} {word}"
+        if _exact_width(font, test) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = test
+    lines.append(current)
+    return lines
+
+
+def check_against_textbbox(fonts, texts, widths):
+    """
+    Compares wrap_text_pixel with the textbbox-based reference. Returns the
+    mismatches as (font size, width, text, expected, got). Texts with a word
+    wider than the line are skipped (the reference does not split words).
+    """
+    mismatches = []
+    for font in fonts:
+        for width in widths:
+            for text in texts:
+                if any(_exact_width(font, w) > width for w in text.split()):
+                    continue
+                expected = _reference_wrap(text, font, width)
+                got = wrap_text_pixel(text, font, width)
+                if got != expected:
+                    mismatches.append((font.size, width, text, expected, got))
+    return mismatches
+
+
+if __name__ == "__main__":
+    import sys
+    from PIL import ImageFont
+
+    FONT_PATH = "/usr/share/fonts/truetype/dejavu/DejaVuSans-Bold.ttf"
+    # Textes reels de l'application (accueil, validation, ecrans lateraux) et une reponse
+    TEXTS = [
+        "Bonjour. Je suis Iana.",
+        "K1: Valider | K2: Annuler",
+        "Relachez K2 pour finir",
+        "(Je n'ai pas compris)",
+        "Maintenez K2 pour parler",
+        "Validez votre texte",
+        "Iana réfléchit...",
+        "Chargement du modele...",
+        "Quelle est la capitale de l'Australie et pourquoi n'est-ce pas Sydney ?",
+        "La capitale de l'Australie est Canberra. Elle a été choisie en 1908 comme compromis "
+        "entre Sydney et Melbourne, les deux plus grandes villes, qui se disputaient ce rôle. "
+        "La ville a été construite spécialement pour accueillir le gouvernement fédéral, "
+        "d'après les plans des architectes américains Walter Burley Griffin et Marion Mahony.",
+    ]
+    # Largeurs utiles : ecran central (240 - 10), validation (240 - 20), ecrans lateraux (160 - 10)
+    WIDTHS = [230, 220, 150]
+
+    fonts = [ImageFont.truetype(FONT_PATH, size) for size in (12, 16, 24)]
+    found = check_against_textbbox(fonts, TEXTS, WIDTHS)
+    for size, width, text, expected, got in found:
+        print(f"DIFFERENCE ({size}px, largeur {width}) : {text!r}")
+        print(f"  textbbox : {expected}")
+        print(f"  wrap     : {got}")
+    print(f"{len(found)} difference(s) sur {len(fonts) * len(WIDTHS) * len(TEXTS)} cas")
+    sys.exit(1 if found else 0)
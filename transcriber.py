@@ -0,0 +1,222 @@
+# Description:
+# Backends de transcription interchangeables pour le push-to-talk.
+# - "google" : recognize_google (API web, comportement historique)
+# - "vosk"   : moteur local hors-ligne (modele francais charge une seule fois au demarrage)
+# - "fake"   : reponses deterministes pour les tests et le profilage
+# Le choix se fait dans la configuration (TRANSCRIBER dans push_to_talk_v2.py).
+# Les backends capables de streaming (vosk, fake) recoivent l'audio pendant que K2 est
+# maintenu ; les autres transcrivent l'enregistrement complet apres relachement.
+
+import json
+import queue
+import threading
+import time
+
+import speech_recognition as sr
+
+SAMPLE_RATE = 16000
+
+
+class StreamingSession:
+    """
+    Incremental recognition running in a worker thread, so the recording
+    loop never waits for the recognizer. feed() queues PCM chunks (16 kHz
+    int16 mono); on_partial(text) is called when the hypothesis changes.
+    """
+    def __init__(self, transcriber, on_partial=None):
+        self.transcriber = transcriber
+        self.on_partial = on_partial
+        self.partial = ""
+        self._queue = queue.Queue()
+        self._result = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _accept(self, data):
+        """Consumes a chunk, returns the current partial hypothesis."""
+        raise NotImplementedError
+
+    def _final(self):
+        """Returns the final text once all audio was consumed."""
+        raise NotImplementedError
+
+    def _run(self):
+        while True:
+            data = self._queue.get()
+            if data is None:
+                break
+            partial = self._accept(data)
+            if partial and partial != self.partial:
+                self.partial = partial
+                if self.on_partial is not None:
+                    self.on_partial(partial)
+        self._result = self._final() or None
+
+    def feed(self, data):
+        self._queue.put(bytes(data))
+
+    def finish(self):
+        """Flushes the remaining audio and returns the final transcript (or None)."""
+        start = time.monotonic()
+        self._queue.put(None)
+        self._thread.join()
+        self.transcriber.last_latency = time.monotonic() - start
+        return self._result
+
+    def cancel(self):
+        """Stops the session and discards its result."""
+        self.on_partial = None
+        self._queue.put(None)
+
+
+class Transcriber:
+    """
+    Base class. transcribe() returns the recognized text, or None.
+    'last_latency' holds the duration of the last call, in seconds.
+    Backends with supports_streaming also provide start_stream().
+    """
+    name = "base"
+    supports_streaming = False
+
+    def __init__(self):
+        self.last_latency = 0.0
+
+    def _transcribe(self, audio_data):
+        raise NotImplementedError
+
+    def transcribe(self, audio_data):
+        start = time.monotonic()
+        try:
+            return self._transcribe(audio_data)
+        finally:
+            self.last_latency = time.monotonic() - start
+
+    def start_stream(self, on_partial=None):
+        """Starts a StreamingSession (only if supports_streaming)."""
+        raise NotImplementedError(f"Le backend '{self.name}' ne fait pas de streaming")
+
+
+class GoogleTranscriber(Transcriber):
+    """Google Web Speech API (needs network)."""
+    name = "google"
+
+    def __init__(self, language="fr-FR"):
+        super().__init__()
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def _transcribe(self, audio_data):
+        try:
+            return self.recognizer.recognize_google(audio_data, language=self.language)
+        except Exception:
+            return None
+
+
+class _VoskSession(StreamingSession):
+    def __init__(self, transcriber, on_partial=None):
+        self.rec = transcriber.vosk.KaldiRecognizer(transcriber.model, SAMPLE_RATE)
+        self._done = []  # Segments deja finalises par Vosk (pauses)
+        super().__init__(transcriber, on_partial)
+
+    def _accept(self, data):
+        if self.rec.AcceptWaveform(data):
+            text = json.loads(self.rec.Result()).get("text", "")
+            if text:
+                self._done.append(text)
+            return " ".join(self._done)
+        partial = json.loads(self.rec.PartialResult()).get("partial", "")
+        return " ".join(self._done + ([partial] if partial else []))
+
+    def _final(self):
+        text = json.loads(self.rec.FinalResult()).get("text", "")
+        return " ".join(self._done + ([text] if text else []))
+
+
+class VoskTranscriber(Transcriber):
+    """
+    Local offline engine (Vosk / Kaldi). The model is loaded once, in the
+    constructor, and stays resident.
+    """
+    name = "vosk"
+    supports_streaming = True
+
+    def __init__(self, model_path):
+        super().__init__()
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("Le backend 'vosk' necessite : pip install vosk")
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def _transcribe(self, audio_data):
+        rec = self.vosk.KaldiRecognizer(self.model, SAMPLE_RATE)
+        rec.AcceptWaveform(audio_data.get_raw_data(convert_rate=SAMPLE_RATE, convert_width=2))
+        text = json.loads(rec.FinalResult()).get("text", "")
+        return text or None
+
+    def start_stream(self, on_partial=None):
+        return _VoskSession(self, on_partial)
+
+
+class _FakeSession(StreamingSession):
+    """Reveals the scripted answer one word per 'chunks_per_word' chunks."""
+    def __init__(self, transcriber, answer, chunks_per_word=4, on_partial=None):
+        self.words = answer.split() if answer else []
+        self.chunks_per_word = chunks_per_word
+        self.chunks = 0
+        super().__init__(transcriber, on_partial)
+
+    def _accept(self, data):
+        self.chunks += 1
+        return " ".join(self.words[:self.chunks // self.chunks_per_word])
+
+    def _final(self):
+        return " ".join(self.words)
+
+
+class FakeTranscriber(Transcriber):
+    """
+    Deterministic backend: returns the scripted answers in turn (cycling),
+    after an optional simulated delay.
+    """
+    name = "fake"
+    supports_streaming = True
+
+    def __init__(self, answers=("Bonjour Iana",), delay=0.0):
+        super().__init__()
+        self.answers = list(answers)
+        self.delay = delay
+        self.calls = 0
+
+    def _transcribe(self, audio_data):
+        if self.delay:
+            time.sleep(self.delay)
+        return self._next_answer()
+
+    def _next_answer(self):
+        answer = self.answers[self.calls % len(self.answers)] if self.answers else None
+        self.calls += 1
+        return answer
+
+    def start_stream(self, on_partial=None):
+        return _FakeSession(self, self._next_answer(), on_partial=on_partial)
+
+
+BACKENDS = {
+    "google": GoogleTranscriber,
+    "vosk": VoskTranscriber,
+    "fake": FakeTranscriber,
+}
+
+
+def make_transcriber(name, **options):
+    """
+    Builds the backend 'name' with its options (e.g. model_path for vosk).
+    """
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Backend de transcription inconnu : {name} (choix : {', '.join(BACKENDS)})")
+    return cls(**options)
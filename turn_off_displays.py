@@ -1,6 +1,5 @@
 import time
-import spidev
-import RPi.GPIO as GPIO
+from hardware import spidev, GPIO
 from waveshare_config import CONFIGS
 
 def turn_off_all():
@@ -0,0 +1,165 @@
+# Description:
+# Trace des latences de chaque tour de conversation, etape par etape.
+# Chaque evenement du tour (appui K2, debut de capture, relachement, transcription,
+# validation, premier token, premier affichage, fin de reponse) est horodate avec
+# time.monotonic(). A la fin du tour, les durees des etapes et les compteurs d'Ollama
+# sont ecrits sur une ligne JSON (journal tournant) et agreges en histogrammes dans un
+# fichier texte Prometheus (collecteur textfile de node_exporter).
+
+import json
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+# (etape, marque de debut, marque de fin)
+STAGES = [
+    ("button_to_record", "k2_press", "capture_start"),
+    ("recording", "capture_start", "k2_release"),
+    ("audio_finalize", "k2_release", "audio_ready"),
+    ("transcription", "audio_ready", "transcript"),
+    ("validation_wait", "transcript", "k1_press"),
+    ("first_token", "k1_press", "first_token"),
+    ("first_paint", "k1_press", "first_paint"),
+    ("generation", "first_token", "llm_done"),
+    ("turn_total", "k2_press", "llm_done"),
+]
+
+# Durees rapportees par Ollama (en nanosecondes) -> etape
+OLLAMA_STAGES = {
+    "load_duration": "model_load",
+    "prompt_eval_duration": "prompt_eval",
+    "eval_duration": "eval",
+}
+
+# Bornes des histogrammes, en secondes
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class TurnTrace:
+    """Timestamps and fields of one turn."""
+    def __init__(self):
+        self.marks = {}
+        self.fields = {}
+        self.wall_time = time.time()
+
+    def mark(self, name, t=None):
+        """Records event 'name' at monotonic time 't' (default: now). First mark wins."""
+        if name not in self.marks:
+            self.marks[name] = time.monotonic() if t is None else t
+
+    def has(self, name):
+        return name in self.marks
+
+    def set(self, **fields):
+        self.fields.update(fields)
+
+    def set_ollama(self, chunk):
+        """Copies Ollama's counters from the final (done) chunk of a chat stream."""
+        for key in ("prompt_eval_count", "eval_count", "load_duration",
+                    "prompt_eval_duration", "eval_duration", "total_duration"):
+            value = chunk.get(key)
+            if value is not None:
+                self.fields[key] = value
+
+    def stages(self):
+        """Duration of each stage whose two marks were recorded, in seconds."""
+        out = {}
+        for stage, start, end in STAGES:
+            if start in self.marks and end in self.marks:
+                out[stage] = self.marks[end] - self.marks[start]
+        for key, stage in OLLAMA_STAGES.items():
+            if self.fields.get(key) is not None:
+                out[stage] = self.fields[key] / 1e9
+        return out
+
+    def to_dict(self):
+        t0 = min(self.marks.values()) if self.marks else 0.0
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.wall_time)),
+            "stages": {k: round(v, 4) for k, v in self.stages().items()},
+            "marks": {k: round(v - t0, 4) for k, v in sorted(self.marks.items(), key=lambda kv: kv[1])},
+            **self.fields,
+        }
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class TraceSink:
+    """
+    Writes finished turns to a rotating JSONL log and keeps Prometheus
+    histograms (per stage) and counters, rewritten atomically after each turn.
+    """
+    def __init__(self, log_path, prom_path=None, max_bytes=1 << 20, backups=3):
+        """
+        Args:
+            log_path (str): JSONL file, rotated at 'max_bytes' with 'backups' old files.
+            prom_path (str): Prometheus textfile (None = disabled).
+        """
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.turns = {}  # outcome -> nombre de tours
+        self.counters = {"audio_overflows": 0, "llm_eval_tokens": 0, "llm_prompt_eval_tokens": 0}
+
+        self.log = logging.getLogger("iana.turns")
+        self.log.setLevel(logging.INFO)
+        self.log.propagate = False
+        handler = logging.handlers.RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.log.addHandler(handler)
+
+    def write(self, trace):
+        record = trace.to_dict()
+        self.log.info(json.dumps(record, ensure_ascii=False))
+
+        with self._lock:
+            for stage, value in trace.stages().items():
+                self.histograms.setdefault(stage, _Histogram()).observe(value)
+            outcome = trace.fields.get("outcome", "unknown")
+            self.turns[outcome] = self.turns.get(outcome, 0) + 1
+            self.counters["audio_overflows"] += trace.fields.get("audio_overflows", 0)
+            self.counters["llm_eval_tokens"] += trace.fields.get("eval_count", 0)
+            self.counters["llm_prompt_eval_tokens"] += trace.fields.get("prompt_eval_count", 0)
+            if self.prom_path is not None:
+                self._write_prom()
+        return record
+
+    def _write_prom(self):
+        lines = [
+            "# HELP iana_turn_stage_seconds Duration of each stage of a conversation turn.",
+            "# TYPE iana_turn_stage_seconds histogram",
+        ]
+        for stage, h in sorted(self.histograms.items()):
+            for bound, n in zip(BUCKETS, h.counts):
+                lines.append(f'iana_turn_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {n}')
+            lines.append(f'iana_turn_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'iana_turn_stage_seconds_sum{{stage="{stage}"}} {h.sum:.6f}')
+            lines.append(f'iana_turn_stage_seconds_count{{stage="{stage}"}} {h.count}')
+
+        lines.append("# HELP iana_turns_total Conversation turns by outcome.")
+        lines.append("# TYPE iana_turns_total counter")
+        for outcome, n in sorted(self.turns.items()):
+            lines.append(f'iana_turns_total{{outcome="{outcome}"}} {n}')
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE iana_{name}_total counter")
+            lines.append(f"iana_{name}_total {value}")
+
+        # Ecriture atomique : le collecteur ne lit jamais un fichier a moitie ecrit
+        tmp = self.prom_path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp, self.prom_path)
@@ -0,0 +1,41 @@
+# Description:
+# Etat de l'interface partage entre l'orchestrateur et le thread d'affichage.
+# Chaque modification produit un nouvel instantane immuable, pousse aux abonnes :
+# le thread d'affichage lit le dernier instantane recu, sans verrou ni variables globales.
+
+import threading
+from collections import namedtuple
+
+# state : etat de l'assistant (IDLE, RECORDING, ...), user_text : texte a valider,
+# bot_strip : bande de l'ecran central, strip_time : date de publication de la bande
+UiSnapshot = namedtuple('UiSnapshot', ['state', 'user_text', 'bot_strip', 'strip_time', 'version'])
+
+
+class UiStore:
+    """
+    Observable UI state. update() publishes a new snapshot to subscribers.
+    """
+    def __init__(self, state="IDLE"):
+        self._lock = threading.Lock()
+        self._snapshot = UiSnapshot(state, "", None, 0.0, 0)
+        self._subscribers = []
+
+    def get(self):
+        return self._snapshot
+
+    def update(self, **changes):
+        """Applies 'changes' (UiSnapshot fields) and notifies subscribers."""
+        with self._lock:
+            snap = self._snapshot._replace(version=self._snapshot.version + 1, **changes)
+            self._snapshot = snap
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            callback(snap)
+        return snap
+
+    def subscribe(self, callback):
+        """Registers callback(snapshot); it is called at once with the current state."""
+        with self._lock:
+            self._subscribers.append(callback)
+            snap = self._snapshot
+        callback(snap)
@@ -1,26 +1,32 @@
 # Configuration Pinout pour Waveshare Triple LCD HAT (Mode BCM)
 
+# Backend materiel (voir hardware.py) : "rpi" sur le Pi, "sim" pour le materiel simule
+# (surcharge possible par la variable d'environnement IANA_HARDWARE)
+HARDWARE = "rpi"
+
 # Ecran 1 : 1.3 inch (Centre) - Utilise SPI1
 # Necessite dtoverlay=spi1-1cs dans /boot/firmware/config.txt
 LCD_1_3 = {
     "name": "1.3 inch (Center)",
+    "controller": "st7789",
     "spi_bus": 1,
     "spi_device": 0,
     "rst": 27,
     "dc": 22,
     "bl": 19,
     "cs": 18, # Hardware CS for SPI1 CE0
-    "madctl": 0x60, # MX + MV + MY (Portrait but upside down ?) -> Needs software rotation
+    "madctl": 0x60, # MX + MV (Portrait but upside down ?) -> corrige par 'rotation'
     "width": 240,
     "height": 240,
     "col_start": 0,
     "row_start": 0,
-    "rotation": 180 # Software rotation needed
+    "rotation": 180 # Rotation appliquee via MADCTL (voir orientation.py), plus de rotation logicielle
 }
 
 # Ecran 2 : 0.96 inch (SPI0 CE0)
 LCD_0_96_1 = {
     "name": "0.96 inch (1)",
+    "controller": "st7735s",
     "spi_bus": 0,
     "spi_device": 0,
     "rst": 24,
@@ -38,6 +44,7 @@ LCD_0_96_1 = {
 # Ecran 3 : 0.96 inch (SPI0 CE1)
 LCD_0_96_2 = {
     "name": "0.96 inch (2)",
+    "controller": "st7735s",
     "spi_bus": 0,
     "spi_device": 1,
     "rst": 23,